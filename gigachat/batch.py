@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import json
+import time
+from itertools import product
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, Optional
+
+from pydantic import BaseModel
+
+from graph import build_graph, make_inputs
+from src.checkpoints import async_checkpointer, thread_config
+from src.roles_and_cases import cases, victims
+from src.utils import MemoryConfig, ScheduleConfig, StallConfig
+
+if TYPE_CHECKING:
+    # pyarrow is only loaded by callers that actually keep results
+    from src.store import ResultsStore
+
+
+class BatchJob(BaseModel):
+    case: str
+    victim: int
+    max_count: int = 10
+    seed: int = 0
+    # Set by sweep workers: sweeps sharing a checkpoint file must not resume each other's dialogues
+    sweep: Optional[str] = None
+
+    @property
+    def thread_id(self):
+        thread_id = f"{self.case}:{self.victim}:{self.max_count}:{self.seed}"
+        return f"{self.sweep}:{thread_id}" if self.sweep is not None else thread_id
+
+
+def settings_key(memory: Optional[MemoryConfig] = None, speculative: bool = False,
+                 stall: Optional[StallConfig] = None, schedule: Optional[ScheduleConfig] = None):
+    # Short hash of the settings that shape a dialogue. It is part of the checkpoint thread id, so a run with
+    # another config never resumes (or returns) a dialogue checkpointed under the old one
+    settings = [config.model_dump() if config is not None else None for config in (memory, stall, schedule)]
+    encoded = json.dumps([*settings, speculative], sort_keys=True)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()[:8]
+
+
+def make_grid(case_keys: Optional[Iterable[str]] = None,
+              victim_keys: Optional[Iterable[int]] = None,
+              max_counts: Iterable[int] = (10,),
+              repeats: int = 1):
+    case_keys = list(case_keys) if case_keys is not None else list(cases)
+    victim_keys = list(victim_keys) if victim_keys is not None else list(victims)
+    return [
+        BatchJob(case=case, victim=victim, max_count=max_count, seed=seed)
+        for case, victim, max_count, seed in product(case_keys, victim_keys, max_counts, range(repeats))
+    ]
+
+
+async def run_job(job: BatchJob, memory: Optional[MemoryConfig] = None, checkpointer=None,
+                  recursion_limit: int = 100, speculative: bool = False, stall: Optional[StallConfig] = None,
+                  schedule: Optional[ScheduleConfig] = None):
+    case = cases[job.case]
+    victim = victims[job.victim]
+    graph = build_graph(case, victim, memory=memory, checkpointer=checkpointer, speculative=speculative,
+                        stall=stall, schedule=schedule)
+
+    thread_id = f"{job.thread_id}:{settings_key(memory, speculative, stall, schedule)}"
+    record = {
+        **job.model_dump(),
+        "thread_id": thread_id,
+        "case_name": case.name,
+        "victim_name": victim["name"],
+    }
+    started = time.perf_counter()
+    try:
+        config = thread_config(thread_id, recursion_limit)
+        inputs = make_inputs(case, job.max_count, job.seed)
+        # With a checkpointer a job that already has a thread continues from its last checkpoint;
+        # a finished one just returns its final state without new LLM calls
+        if checkpointer is not None and (await graph.aget_state(config)).values:
+            inputs = None
+        state = await graph.ainvoke(inputs, config)
+    except Exception as e:
+        record.update({"error": f"{type(e).__name__}: {e}", "elapsed": time.perf_counter() - started})
+        return record
+
+    record.update({
+        "messages": [t["line"] for t in state.get("transcript", [])],
+        "transcript": state.get("transcript", []),
+        "verdicts": state.get("verdicts", []),
+        "message_count": state.get("message_count", 0),
+        "is_scammed": state.get("is_scammed", False),
+        "outcome": state.get("outcome"),
+        "analysis": state.get("analysis"),
+        "metrics": state.get("metrics", []),
+        "error": None,
+        "elapsed": time.perf_counter() - started,
+    })
+    return record
+
+
+async def iter_batch(jobs: Iterable[BatchJob], concurrency: int = 16,
+                     memory: Optional[MemoryConfig] = None,
+                     checkpoint_path: Optional[str] = None,
+                     speculative: bool = False,
+                     stall: Optional[StallConfig] = None,
+                     schedule: Optional[ScheduleConfig] = None) -> AsyncIterator[dict]:
+    # A fixed pool of workers pulls jobs lazily, so at most `concurrency` dialogues are in flight
+    # and the grid itself can be arbitrarily large.
+    # Re-running a batch with the same checkpoint_path resumes it instead of starting over.
+    pending = iter(jobs)
+    results = asyncio.Queue()
+
+    async with (async_checkpointer(checkpoint_path) if checkpoint_path else nullcontext()) as checkpointer:
+        async def worker():
+            for job in pending:
+                await results.put(await run_job(job, memory, checkpointer, speculative=speculative, stall=stall,
+                                                   schedule=schedule))
+
+        async def drain():
+            try:
+                await asyncio.gather(*(worker() for _ in range(concurrency)))
+            finally:
+                await results.put(None)
+
+        runner = asyncio.create_task(drain())
+        try:
+            while (record := await results.get()) is not None:
+                yield record
+            await runner
+        finally:
+            runner.cancel()
+
+
+async def run_batch(jobs: Iterable[BatchJob], output_path: str, concurrency: int = 16,
+                    memory: Optional[MemoryConfig] = None, checkpoint_path: Optional[str] = None,
+                    on_result: Optional[Callable[[dict], None]] = None, speculative: bool = False,
+                    store: Optional["ResultsStore"] = None, stall: Optional[StallConfig] = None,
+                    schedule: Optional[ScheduleConfig] = None):
+    summary = {"total": 0, "scammed": 0, "stalled": 0, "failed": 0, "elapsed": 0.0}
+    started = time.perf_counter()
+    with open(output_path, "w", encoding="utf-8") as out:
+        async for record in iter_batch(jobs, concurrency, memory, checkpoint_path, speculative, stall, schedule):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            summary["total"] += 1
+            summary["scammed"] += bool(record.get("is_scammed"))
+            summary["stalled"] += record.get("outcome") == "stalled"
+            summary["failed"] += record["error"] is not None
+            if store is not None:
+                store.add(record["thread_id"], record["case"], record["victim_name"], record,
+                          source="batch", error=record["error"])
+            if on_result is not None:
+                on_result(record)
+    if store is not None:
+        store.flush()
+    summary["elapsed"] = time.perf_counter() - started
+    return summary
+
+
+# jobs = make_grid(repeats=5)
+# print(asyncio.run(run_batch(jobs, "results.jsonl", concurrency=32)))
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from batch import iter_batch, make_grid
+from graph import build_graph, make_inputs, schedule_stats, set_llm, speculation_stats
+from src.fake_llm import FakeChatModel
+from src.pool import PooledChatModel, RateLimiter
+from src.roles_and_cases import cases, victims
+from src.utils import ScheduleConfig
+
+# Framework-side benchmarks on top of FakeChatModel: every number here excludes real API latency,
+# so a regression means our graph/runner code got slower, not GigaChat.
+
+# module -> top-level packages it must not load at import time
+STARTUP_GUARDS = {
+    "src.roles_and_cases": ("langchain_core", "langgraph", "langchain_gigachat", "gigachat", "pyarrow", "dotenv"),
+    "src.config": ("dotenv",),
+    "cli": ("langchain_core", "langgraph", "pyarrow", "streamlit"),
+    "graph": ("langchain_gigachat", "gigachat", "pyarrow", "streamlit", "IPython", "dotenv"),
+    "batch": ("langchain_gigachat", "gigachat", "pyarrow", "streamlit", "IPython", "dotenv"),
+    "src.store": ("langchain_gigachat", "gigachat", "streamlit", "dotenv"),
+    "rescore": ("langchain_gigachat", "gigachat", "streamlit", "dotenv"),
+}
+
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - started
+print(json.dumps({{"seconds": seconds, "packages": sorted({{name.split(".")[0] for name in sys.modules}})}}))
+"""
+
+
+def _grid(dialogues: int, max_count: int):
+    jobs = make_grid(max_counts=(max_count,), repeats=dialogues)
+    return jobs[:dialogues]
+
+
+async def _drain(jobs, concurrency: int, speculative: bool = False):
+    done = 0
+    async for record in iter_batch(jobs, concurrency, speculative=speculative):
+        if record["error"] is not None:
+            raise RuntimeError(record["error"])
+        done += 1
+    return done
+
+
+def bench_startup(repeats: int = 3):
+    # Every module is imported in a fresh interpreter; the best of a few runs hides disk cache noise
+    rows = {}
+    for module, forbidden in STARTUP_GUARDS.items():
+        runs = [json.loads(subprocess.run([sys.executable, "-c", STARTUP_PROBE.format(module=module)],
+                                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True,
+                                          text=True, check=True).stdout)
+                for _ in range(repeats)]
+        rows[module] = {
+            "seconds": min(run["seconds"] for run in runs),
+            "leaked": sorted(set(runs[0]["packages"]) & set(forbidden)),
+        }
+    return rows
+
+
+def bench_node_overhead(dialogues: int = 50, max_count: int = 10):
+    model = FakeChatModel(seed=0)
+    set_llm(model)
+
+    prompt = [SystemMessage(content="Тебя зовут Иван Иваныч."), HumanMessage(content="Скам Скамыч: привет")]
+    started = time.perf_counter()
+    for _ in range(200):
+        model.invoke(prompt)
+    model_call = (time.perf_counter() - started) / 200
+    model.calls = 0
+
+    case = cases["investments"]
+    graph = build_graph(case, victims[0])
+    nodes = 0
+    started = time.perf_counter()
+    for seed in range(dialogues):
+        for _ in graph.stream(make_inputs(case, max_count, seed), stream_mode="updates"):
+            nodes += 1
+    elapsed = time.perf_counter() - started
+
+    return {
+        "dialogues": dialogues,
+        "nodes": nodes,
+        "llm_calls": model.calls,
+        "model_call_ms": model_call * 1000,
+        "node_overhead_ms": (elapsed - model.calls * model_call) / nodes * 1000,
+    }
+
+
+def bench_throughput(concurrency: int, dialogues: int, max_count: int = 10,
+                     latency_mean: float = 0.05, latency_std: float = 0.02):
+    model = FakeChatModel(latency="lognormal", latency_mean=latency_mean, latency_std=latency_std, seed=0)
+    set_llm(model)
+    started = time.perf_counter()
+    done = asyncio.run(_drain(_grid(dialogues, max_count), concurrency))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "dialogues": done,
+        "seconds": elapsed,
+        "dialogues_per_sec": done / elapsed,
+        "llm_calls_per_sec": model.calls / elapsed,
+    }
+
+
+def bench_memory(concurrency: int, max_count: int = 10, latency_mean: float = 0.2):
+    # Long fixed latency keeps every dialogue in flight at once, so the traced peak is dominated by them
+    set_llm(FakeChatModel(latency_mean=latency_mean, seed=0))
+    build_graph(cases["investments"], victims[0])
+    build_graph(cases["investments"], victims[1])
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    asyncio.run(_drain(_grid(concurrency, max_count), concurrency))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "concurrency": concurrency,
+        "peak_kb": (peak - baseline) / 1024,
+        "kb_per_dialogue": (peak - baseline) / 1024 / concurrency,
+    }
+
+
+def bench_speculation(dialogues: int, max_count: int = 10, latency_mean: float = 0.05):
+    # Fixed latency and sequential dialogues: the difference is the analyst calls taken off the critical path
+    rows = {}
+    for speculative in (False, True):
+        model = FakeChatModel(latency_mean=latency_mean, seed=0)
+        set_llm(model)
+        speculation_stats.clear()
+        started = time.perf_counter()
+        asyncio.run(_drain(_grid(dialogues, max_count), 1, speculative))
+        elapsed = time.perf_counter() - started
+        outcomes = Counter()
+        for (_, outcome), n in speculation_stats.items():
+            outcomes[outcome] += n
+        rows["speculative" if speculative else "sequential"] = {
+            "seconds_per_dialogue": elapsed / dialogues,
+            "llm_calls": model.calls,
+            "speculation_used": outcomes["used"],
+            "speculation_wasted": outcomes["wasted"],
+        }
+    return rows
+
+
+def bench_quota(rps: float, dialogues: int, concurrency: int = 64, max_count: int = 10,
+                latency_mean: float = 0.05):
+    # Many more dialogues than the quota allows: the pool should keep the request rate at the quota, not above
+    pool = PooledChatModel(model=FakeChatModel(latency_mean=latency_mean, seed=0), limiter=RateLimiter(rps, burst=1))
+    set_llm(pool)
+    asyncio.run(_drain(_grid(dialogues, max_count), concurrency))
+    return {"quota_rps": rps, **pool.stats()}
+
+
+def bench_schedule(dialogues: int, max_count: int = 20, concurrency: int = 16,
+                   policies=("every", "escalate")):
+    # Victims agree at a known round (or never) with a reply the success rules leave to the LLM analyst,
+    # so the final verdicts can be checked against the truth; "always" is the every-turn baseline.
+    # Only rounds the dialogue reaches count, otherwise every policy, "always" included, looks wrong there
+    rounds = (None, 2, 4, 6, max_count // 2)
+    agree_rounds = tuple(dict.fromkeys(r for r in rounds if r is None or r <= max_count // 2))
+    rows = {}
+    for policy in ("always", *policies):
+        schedule = ScheduleConfig(policy=policy)
+        schedule_stats.clear()
+        calls = correct = delay = detected = total = 0
+        for agree_at in agree_rounds:
+            set_llm(FakeChatModel(agree_at=agree_at, agree_reply="Готов, давайте попробуем", seed=0))
+            records = []
+
+            async def collect():
+                async for record in iter_batch(_grid(dialogues, max_count), concurrency, schedule=schedule):
+                    if record["error"] is not None:
+                        raise RuntimeError(record["error"])
+                    records.append(record)
+
+            asyncio.run(collect())
+            for record in records:
+                total += 1
+                calls += sum(m["node"] == "analyst" and m["source"] != "rules" for m in record["metrics"])
+                correct += record["is_scammed"] == (agree_at is not None)
+                scammed_at = next((v["turn"] for v in record["verdicts"] if v["is_scammed"]), None)
+                if agree_at is not None and scammed_at is not None:
+                    detected += 1
+                    delay += scammed_at - 2 * agree_at
+        rows[policy] = {
+            "analyst_calls_per_dialogue": calls / total,
+            "accuracy": correct / total,
+            "detection_delay_messages": delay / detected if detected else None,
+            "skipped": sum(n for (_, kind), n in schedule_stats.items() if kind == "skipped"),
+        }
+    return rows
+
+
+def bench_scaling(levels, dialogues: int, **kwargs):
+    rows = [bench_throughput(c, max(dialogues, c), **kwargs) for c in levels]
+    base = rows[0]["dialogues_per_sec"] / rows[0]["concurrency"]
+    for row in rows:
+        row["efficiency"] = row["dialogues_per_sec"] / (base * row["concurrency"])
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the dialogue graph")
+    parser.add_argument("--dialogues", type=int, default=64)
+    parser.add_argument("--max-count", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="mean fake LLM latency, seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--startup-only", action="store_true", help="only check import time and import guards")
+    args = parser.parse_args()
+
+    startup = bench_startup()
+    for module, row in startup.items():
+        leaked = f", loads {', '.join(row['leaked'])}" if row["leaked"] else ""
+        print(f"import {module}: {row['seconds'] * 1000:.0f} ms{leaked}")
+    leaks = {module: row["leaked"] for module, row in startup.items() if row["leaked"]}
+    if args.startup_only:
+        if leaks:
+            raise SystemExit(f"heavy imports leaked: {leaks}")
+        return
+
+    set_llm_cache(None)
+    results = {
+        "startup": startup,
+        "node_overhead": bench_node_overhead(max_count=args.max_count),
+        "scaling": bench_scaling(args.concurrency, args.dialogues,
+                                 max_count=args.max_count, latency_mean=args.latency),
+        "memory": bench_memory(max(args.concurrency), max_count=args.max_count),
+        "quota": bench_quota(50, min(args.dialogues, 32), max_count=args.max_count, latency_mean=args.latency),
+        "schedule": bench_schedule(min(args.dialogues, 16), max_count=max(args.max_count, 10)),
+        "speculation": bench_speculation(min(args.dialogues, 16), max_count=args.max_count,
+                                         latency_mean=args.latency),
+    }
+
+    overhead = results["node_overhead"]
+    print(f"node overhead: {overhead['node_overhead_ms']:.3f} ms/node "
+          f"(fake model call {overhead['model_call_ms']:.3f} ms, {overhead['nodes']} nodes)")
+    print(f"{'concurrency':>12} {'dialogues/s':>12} {'llm calls/s':>12} {'efficiency':>11}")
+    for row in results["scaling"]:
+        print(f"{row['concurrency']:>12} {row['dialogues_per_sec']:>12.2f} "
+              f"{row['llm_calls_per_sec']:>12.1f} {row['efficiency']:>11.2f}")
+    memory = results["memory"]
+    print(f"memory: {memory['kb_per_dialogue']:.1f} KiB per in-flight dialogue at concurrency {memory['concurrency']}")
+    quota = results["quota"]
+    print(f"quota: {quota['rps']:.1f} of {quota['quota_rps']} rps, peak {quota['peak_in_flight']} in flight, "
+          f"{quota['throttled_seconds']:.1f} s spent queued")
+    sequential, speculative = results["speculation"]["sequential"], results["speculation"]["speculative"]
+    print(f"speculation: {sequential['seconds_per_dialogue']:.3f} -> {speculative['seconds_per_dialogue']:.3f} s/dialogue, "
+          f"{speculative['speculation_wasted']} of {speculative['speculation_used'] + speculative['speculation_wasted']} "
+          f"speculative turns wasted")
+    always = results["schedule"]["always"]
+    for policy, row in results["schedule"].items():
+        delay = row["detection_delay_messages"]
+        print(f"analyst schedule {policy}: {row['analyst_calls_per_dialogue']:.2f} LLM calls/dialogue "
+              f"({row['analyst_calls_per_dialogue'] / always['analyst_calls_per_dialogue']:.0%} of always), "
+              f"accuracy {row['accuracy']:.0%}, agreement detected "
+              f"{'never' if delay is None else f'{delay:.1f} messages late'}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if leaks:
+        raise SystemExit(f"heavy imports leaked: {leaks}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import sys
+import time
+
+# Headless runner for servers and schedulers:
+#   python cli.py investments 0 --runs 20 --concurrency 8 --output runs.jsonl
+# One JSON line per finished dialogue goes to --output, progress goes to stderr.
+# The graph stack is only imported once the arguments are valid, so --help and usage errors return at once,
+# and nothing from Streamlit or Jupyter is ever loaded.
+
+# "cues" is left out: victims who talk about the offer at all mostly use money words, so it saves little over
+# "always" unless ScheduleConfig.cues is tuned per case
+POLICIES = ("always", "every", "escalate")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run fraud dialogues without the UI and write them as JSONL")
+    parser.add_argument("cases", nargs="+", help="case keys from src.roles_and_cases.cases, e.g. investments")
+    parser.add_argument("--victims", nargs="+", type=int, default=[0], help="victim keys, default 0")
+    parser.add_argument("--runs", type=int, default=1, help="dialogues per case and victim (seeds 0..runs-1)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--max-count", type=int, default=10, help="messages per dialogue")
+    parser.add_argument("--output", default="runs.jsonl", help="JSONL file, '-' for stdout")
+    parser.add_argument("--checkpoints", help="SQLite checkpoint file; re-running with it resumes unfinished runs")
+    parser.add_argument("--store", action="store_true", help="also append results to the Parquet results store")
+    parser.add_argument("--memory-window", type=int, help="fold turns older than this into a running summary")
+    parser.add_argument("--speculative", action="store_true", help="overlap the analyst with the next scammer turn")
+    parser.add_argument("--no-stall", action="store_true", help="do not end looping dialogues early")
+    parser.add_argument("--schedule", choices=POLICIES, default="always", help="when the LLM analyst is asked")
+    parser.add_argument("--fake-llm", type=float, metavar="LATENCY",
+                        help="offline dry run with src.fake_llm and this mean latency, seconds")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+    if args.runs < 1 or args.concurrency < 1:
+        parser.error("--runs and --concurrency must be positive")
+    return parser, args
+
+
+def progress(record: dict, done: int, total: int, out=sys.stderr):
+    if record["error"] is not None:
+        status = f"failed: {record['error']}"
+    else:
+        status = f"{record['outcome'] or 'not scammed'} after {record['message_count']} messages"
+    print(f"[{done}/{total}] {record['thread_id']} {status} ({record['elapsed']:.1f} s)", file=out, flush=True)
+
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+
+    from batch import make_grid, run_batch
+    from src.roles_and_cases import cases, victims
+    from src.utils import MemoryConfig, ScheduleConfig, StallConfig
+
+    unknown = [c for c in args.cases if c not in cases] + [str(v) for v in args.victims if v not in victims]
+    if unknown:
+        parser.error(f"unknown case or victim keys: {', '.join(unknown)}; cases: {', '.join(cases)}, "
+                     f"victims: {', '.join(map(str, victims))}")
+
+    if args.fake_llm is not None:
+        from langchain_core.globals import set_llm_cache
+
+        from graph import set_llm
+        from src.fake_llm import FakeChatModel
+        set_llm(FakeChatModel(latency_mean=args.fake_llm))
+        set_llm_cache(None)
+
+    store = None
+    if args.store:
+        from src.store import ResultsStore
+        store = ResultsStore()
+
+    jobs = make_grid(args.cases, args.victims, max_counts=(args.max_count,), repeats=args.runs)
+    done = 0
+
+    def on_result(record):
+        nonlocal done
+        done += 1
+        if not args.quiet:
+            progress(record, done, len(jobs))
+
+    print(f"{len(jobs)} dialogues, concurrency {args.concurrency}", file=sys.stderr, flush=True)
+    started = time.perf_counter()
+    summary = asyncio.run(run_batch(
+        jobs,
+        "/dev/stdout" if args.output == "-" else args.output,
+        concurrency=args.concurrency,
+        memory=MemoryConfig(window=args.memory_window) if args.memory_window else None,
+        checkpoint_path=args.checkpoints,
+        on_result=on_result,
+        speculative=args.speculative,
+        store=store,
+        stall=None if args.no_stall else StallConfig(),
+        schedule=ScheduleConfig(policy=args.schedule),
+    ))
+    print(f"done in {time.perf_counter() - started:.1f} s: {summary['total']} dialogues, "
+          f"{summary['scammed']} scammed, {summary['stalled']} stalled, {summary['failed']} failed",
+          file=sys.stderr, flush=True)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,27 @@
+from functools import lru_cache
+from uuid import uuid4
+
 import streamlit as st
-from graph import graph
+from graph import build_graph, fork_run, make_inputs
+from src.checkpoints import get_checkpointer, thread_config
+from src.config import METRICS_PORT, SIM_WORKERS
+from src.metrics import start_metrics_server, summary as metrics_summary
 from src.roles_and_cases import *  # Assuming you have this structure
-from src.utils import DialogState  # Import your DialogState type
+from src.runs import ACTIVE, Run, RunManager
+from src.utils import DialogState, MemoryConfig, ScheduleConfig, StallConfig  # Import your DialogState type
 
 fraud_cases = {"Инвестиции под 100% mom saar": investments,
                "Безопасный счет ЦБ": secure_account}
+# Display name -> key in roles_and_cases.cases, which is how the results store names cases
+case_keys = {name: key for name, case in fraud_cases.items() for key, c in cases.items() if c is case}
+# How often a running simulation is polled for new messages; tokens keep streaming into the run in between
+POLL_INTERVAL = 0.5
+# Sidebar label -> src.scheduling policy
+SCHEDULE_OPTIONS = {
+    "После каждого ответа жертвы": "always",
+    "Раз в несколько ответов": "every",
+    "Чаще к концу диалога": "escalate",
+}
 st.set_page_config(
     page_title="Fraud Simulation Dashboard",
     page_icon="🕵️‍♂️",
@@ -59,100 +76,224 @@ st.markdown("""
 
 
 def initialize_session_state():
-    if 'dialogue_history' not in st.session_state:
-        st.session_state.dialogue_history = []
-    if 'analyst_history' not in st.session_state:
-        st.session_state.analyst_history = []
-    if 'simulation_running' not in st.session_state:
-        st.session_state.simulation_running = False
     if 'current_case' not in st.session_state:
         st.session_state.current_case = "investments"
     if 'current_victim' not in st.session_state:
         st.session_state.current_victim = 0
+    if 'run' not in st.session_state:
+        st.session_state.run = None
+
 
+@lru_cache(maxsize=None)
+def victim_avatar(victim_index):
+    return "👵" if "женщина" in victims[victim_index]["bio"].lower() else "👴"
 
-def clear_history():
-    st.session_state.dialogue_history = []
-    st.session_state.analyst_history = []
 
+def render_message(role, message, count, victim_index):
+    with st.chat_message("assistant" if role == "scammer" else "user",
+                         avatar="🦹‍♂️" if role == "scammer" else victim_avatar(victim_index)):
+        st.markdown(message)
+        st.caption(f"Сообщение #{count}")
 
-def generate_response(fraud_scheme, max_count, case_name, victim_index):
-    clear_history()
-    st.session_state.simulation_running = True
+
+def render_verdict(analysis, is_scammed, count, expanded):
+    with st.expander(f"Анализ после сообщения #{count}", expanded=expanded):
+        st.markdown("**Результат анализа:**")
+        st.markdown(f"> {analysis}")
+        # Display decision with appropriate styling
+        decision_class = "scammed" if is_scammed else "not-scammed"
+        decision_text = "Жертва разведена! 🚨" if is_scammed else "Жертва не разведена"
+        st.markdown(f'<div class="analyst-decision {decision_class}">{decision_text}</div>',
+                    unsafe_allow_html=True)
+        if is_scammed:
+            st.success("Мошенничество успешно проведено!", icon="✅")
+        else:
+            st.info("Диалог продолжается...", icon="🔄")
+
+
+def render_metrics():
+    rows = metrics_summary()
+    if not rows:
+        st.caption("Пока не было ни одного вызова")
+    else:
+        st.dataframe([
+            {
+                "Узел": node,
+                "Вызовы": row["calls"],
+                "Из кэша": row["cache"],
+                "По правилам": row["rules"],
+                "Среднее время, с": round(row["mean_seconds"], 2),
+                "Токены запроса": row["prompt_tokens"],
+                "Токены ответа": row["completion_tokens"],
+                "Повторы": row["retries"],
+                "Стоимость, ₽": round(row["cost"], 2),
+            }
+            for node, row in rows.items()
+        ], hide_index=True)
+    if METRICS_PORT:
+        st.caption(f"Prometheus: http://localhost:{METRICS_PORT}/metrics")
+
+
+@st.cache_resource
+def results_store():
+    # Finished runs are written right away, so they outlive "Сбросить" and show up on the analytics page.
+    # Imported here so the first page render does not wait for pyarrow
+    from src.store import ResultsStore
+    return ResultsStore(flush_every=1)
+
+
+@st.cache_resource
+def run_manager():
+    # Shared by every session of the server process, so a room full of users runs in parallel
+    # and nobody's script thread is blocked while a dialogue is generated
+    return RunManager(workers=SIM_WORKERS)
+
+
+def run_graph(case_name, victim_index, education, memory, stall=None, schedule=None):
+    victim = with_education(victims[victim_index], education)
+    return build_graph(fraud_cases[case_name], victim, memory=memory, checkpointer=get_checkpointer(), stall=stall,
+                       schedule=schedule)
+
+
+def submit_run(max_count, case_name, victim_index, memory=None, education=None, mode="start", fork_turn=None,
+               stall=None, schedule=None):
+    # mode="start" runs a new dialogue, "resume" continues the failed run from its last checkpoint,
+    # "fork" branches the current run after message #fork_turn with the given victim and material
+    victim_name = victims[victim_index]["name"]
+    graph = run_graph(case_name, victim_index, education, memory, stall, schedule)
+    inputs, dialogue, verdicts = None, [], []
+    if mode == "resume":
+        source = run_manager().get(st.session_state.run["thread_id"]).snapshot()
+        thread_id, dialogue, verdicts = source["run_id"], source["dialogue"], source["verdicts"]
+    elif mode == "fork":
+        source = st.session_state.run
+        source_graph = run_graph(source["case_name"], source["victim_index"], source["education"], source["memory"],
+                                 source["stall"], source["schedule"])
+        thread_id = fork_run(source_graph, source["thread_id"], fork_turn, target_graph=graph, max_count=max_count)
+        prefix = run_manager().get(source["thread_id"]).snapshot()
+        dialogue = [e for e in prefix["dialogue"] if e[2] <= fork_turn]
+        verdicts = [e for e in prefix["verdicts"] if e[2] <= fork_turn]
+    else:
+        thread_id = str(uuid4())
+        inputs = make_inputs(fraud_cases[case_name], max_count)
+
+    meta = {"thread_id": thread_id, "case_name": case_name, "victim_index": victim_index,
+            "education": education, "memory": memory, "stall": stall, "schedule": schedule}
+    # Finished runs are written right away, so they outlive "Сбросить" and show up on the analytics page
+    store = results_store()
+
+    def save_run(run):
+        state = graph.get_state(thread_config(thread_id)).values
+        store.add(thread_id, case_keys[case_name], victim_name, state, source="ui")
+
+    run_manager().submit(Run(thread_id, meta, dialogue, verdicts), graph, inputs, thread_config(thread_id),
+                         speakers={fraud_cases[case_name].profiles["scammer"]["name"]: "scammer",
+                                   victim_name: "victim"},
+                         on_done=save_run)
     st.session_state.current_case = case_name
     st.session_state.current_victim = victim_index
+    st.session_state.run = meta
+    # The run id in the URL lets a reloaded or shared page reattach to the run
+    st.query_params["run"] = thread_id
+
+
+def current_run():
+    # Reattaches to the run named in the URL (after a reload) and returns a snapshot of the session's run
+    run_id = st.query_params.get("run")
+    if run_id and (st.session_state.run is None or st.session_state.run["thread_id"] != run_id):
+        run = run_manager().get(run_id)
+        if run is None:
+            del st.query_params["run"]
+        else:
+            st.session_state.run = run.meta
+            st.session_state.current_case = run.meta["case_name"]
+            st.session_state.current_victim = run.meta["victim_index"]
+    if st.session_state.run is None:
+        return None
+    run = run_manager().get(st.session_state.run["thread_id"])
+    return run.snapshot() if run is not None else None
+
+
+def render_live(placeholder, snapshot, victim_index):
+    if snapshot["live"]:
+        role, text = snapshot["live"]
+        with placeholder.container():
+            with st.chat_message("assistant" if role == "scammer" else "user",
+                                 avatar="🦹‍♂️" if role == "scammer" else victim_avatar(victim_index)):
+                st.markdown(text + "▌")
+    elif snapshot["status"] == "queued":
+        placeholder.caption("Симуляция ждет свободного обработчика...")
+    else:
+        placeholder.empty()
+
+
+def render_run(snapshot):
+    # Draws the run as it is now and returns the feeds and placeholders live_run adds to afterwards
+    victim_index = snapshot["meta"]["victim_index"] if snapshot else st.session_state.current_victim
+    col1, col2 = st.columns([2, 1])
 
-    # Get the actual victim name from the victims dictionary
-    victim_name = victims[victim_index]["name"]
+    with col1:
+        st.subheader("💬 Диалог между мошенником и жертвой")
+        dialogue_feed = st.container()
+        live = st.empty()
+        if snapshot is None or not (snapshot["dialogue"] or snapshot["live"] or snapshot["status"] in ACTIVE):
+            live.info("Диалог будет отображен здесь после запуска симуляции")
+        else:
+            with dialogue_feed:
+                for role, message, count in snapshot["dialogue"]:
+                    render_message(role, message, count, victim_index)
+            render_live(live, snapshot, victim_index)
+            if snapshot["status"] == "failed":
+                st.error(f"Ошибка при выполнении симуляции: {snapshot['error']}")
+                with st.expander("Подробности"):
+                    st.code(snapshot["traceback"])
 
-    inputs = {
-        "fraud_scheme": fraud_scheme,
-        "fraud_success": fraud_cases[case_name].success_condition,
-        "messages": [],
-        "message_count": 0,
-        "max_count": max_count
-    }
-    dialogue_col, analyst_col = st.columns([2, 1])
-    with dialogue_col:
-        dialogue_container = st.empty()
-    with analyst_col:
-        analyst_container = st.empty()
-    try:
-        for update in graph.stream(inputs, {"recursion_limit": 100}, stream_mode="updates"):
-            if "Скам Скамыч" in update:
-                msg = update["Скам Скамыч"]["messages"][0]
-                st.session_state.dialogue_history.append(("scammer", msg, update["Скам Скамыч"]["message_count"]))
-                with dialogue_container.container():
-                    st.subheader("💬 Диалог")
-                    for role, message, count in st.session_state.dialogue_history:
-                        with st.chat_message("assistant" if role == "scammer" else "user",
-                                             avatar="🦹‍♂️" if role == "scammer" else "👴"):
-                            st.markdown(message)
-                            st.caption(f"Сообщение #{count}")
-
-            # Use dynamic victim name
-            if victim_name in update:
-                msg = update[victim_name]["messages"][0]
-                st.session_state.dialogue_history.append(("victim", msg, update[victim_name]["message_count"]))
-                with dialogue_container.container():
-                    st.subheader("💬 Диалог")
-                    for role, message, count in st.session_state.dialogue_history:
-                        # Use appropriate avatar based on current victim
-                        victim = victims[victim_index]
-                        avatar = "👵" if "женщина" in victim["bio"].lower() else "👴"
-
-                        with st.chat_message("assistant" if role == "scammer" else "user",
-                                             avatar="🦹‍♂️" if role == "scammer" else avatar):
-                            st.markdown(message)
-                            st.caption(f"Сообщение #{count}")
-
-            if "analyst" in update:
-                analysis = update["analyst"].get("analysis", "Анализ...")
-                is_scammed = update["analyst"].get("is_scammed", False)
-                message_count = st.session_state.dialogue_history[-1][2] if st.session_state.dialogue_history else 0
-                st.session_state.analyst_history.append((analysis, is_scammed, message_count))
-                with analyst_container.container():
-                    st.subheader("🕵️‍♂️ Анализ")
-                    for idx, (analysis, is_scammed, count) in enumerate(st.session_state.analyst_history):
-                        with st.expander(f"Анализ после сообщения #{count}",
-                                         expanded=(idx == len(st.session_state.analyst_history) - 1)):
-                            st.markdown("**Результат анализа:**")
-                            st.markdown(f"> {analysis}")
-                            decision_class = "scammed" if is_scammed else "not-scammed"
-                            decision_text = "Жертва разведена! 🚨" if is_scammed else "Жертва не разведена"
-                            st.markdown(f'<div class="analyst-decision {decision_class}">{decision_text}</div>',
-                                        unsafe_allow_html=True)
-                            if is_scammed:
-                                st.success("Мошенничество успешно проведено!", icon="✅")
-                            else:
-                                st.info("Диалог продолжается...", icon="🔄")
-            import time
-            time.sleep(0.5)
-    except Exception as e:
-        st.error(f"Ошибка при выполнении симуляции: {str(e)}")
-        st.exception(e)
-    finally:
-        st.session_state.simulation_running = False
+    with col2:
+        st.subheader("🕵️‍♂️ Анализ мошеннической активности")
+        analyst_feed = st.container()
+        latest_verdict = st.empty()
+        if snapshot is None or not snapshot["verdicts"]:
+            latest_verdict.info("Анализ будет отображен здесь после запуска симуляции")
+        else:
+            with analyst_feed:
+                for analysis, is_scammed, count in snapshot["verdicts"][:-1]:
+                    render_verdict(analysis, is_scammed, count, expanded=False)
+            with latest_verdict.container():
+                render_verdict(*snapshot["verdicts"][-1], expanded=True)
+        if snapshot is not None and snapshot["outcome"] == "stalled":
+            st.warning("Диалог зациклился и остановлен досрочно", icon="🔁")
+
+    st.session_state.drawn = {"turns": len(snapshot["dialogue"]) if snapshot else 0,
+                              "verdicts": len(snapshot["verdicts"]) if snapshot else 0}
+    return dialogue_feed, live, analyst_feed, latest_verdict
+
+
+@st.fragment(run_every=POLL_INTERVAL)
+def live_run(run_id, panels):
+    # Polls the running simulation and only adds what it produced since the last poll. The panels come from
+    # render_run outside the fragment, so elements written to them stay across fragment reruns; the streaming
+    # bubble and the latest verdict are the only ones replaced in place
+    dialogue_feed, live, analyst_feed, latest_verdict = panels
+    snapshot = run_manager().get(run_id).snapshot()
+    victim_index = snapshot["meta"]["victim_index"]
+    drawn = st.session_state.drawn
+    dialogue, verdicts = snapshot["dialogue"], snapshot["verdicts"]
+
+    with dialogue_feed:
+        for role, message, count in dialogue[drawn["turns"]:]:
+            render_message(role, message, count, victim_index)
+    render_live(live, snapshot, victim_index)
+    if len(verdicts) > drawn["verdicts"]:
+        # The verdict shown as the latest so far moves to the feed collapsed, together with any newer but one
+        with analyst_feed:
+            for analysis, is_scammed, count in verdicts[max(drawn["verdicts"] - 1, 0):-1]:
+                render_verdict(analysis, is_scammed, count, expanded=False)
+        with latest_verdict.container():
+            render_verdict(*verdicts[-1], expanded=True)
+    drawn.update(turns=len(dialogue), verdicts=len(verdicts))
+
+    if snapshot["status"] not in ACTIVE:
+        st.rerun()
 
 
 def main():
@@ -161,6 +302,10 @@ def main():
 
     # Initialize session state
     initialize_session_state()
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    snapshot = current_run()
+    running = snapshot is not None and snapshot["status"] in ACTIVE
 
     with st.sidebar:
         st.header("⚙️ Настройки симуляции")
@@ -184,96 +329,100 @@ def main():
         )
         selected_victim_idx = victim_options[selected_victim_name]
 
-        # Добавляем заглушку для выбора образовательных материалов
         st.subheader("Образовательные материалы")
-        education_options = ["Ничего", "Статья Финкульта про мошенничество"]
-        st.selectbox(
+        education_options = ["Ничего"] + list(education_materials)
+        selected_education = st.selectbox(
             "Выберите материал",
             options=education_options,
             index=0
         )
+        selected_education = None if selected_education == "Ничего" else selected_education
 
         st.subheader("Параметры симуляции")
         max_messages = st.slider("Максимальное количество сообщений", 5, 50, 10)
+        use_memory = st.checkbox("Сворачивать старые реплики в краткое содержание", value=False)
+        memory_window = st.slider("Реплик без сокращения", 2, 20, 6, disabled=not use_memory)
+        stop_stalled = st.checkbox("Останавливать зациклившиеся диалоги", value=True,
+                                   help="Повторяющиеся реплики или серия отказов жертвы завершают диалог досрочно")
+        schedule_policy = st.selectbox(
+            "Когда звать аналитика",
+            options=list(SCHEDULE_OPTIONS),
+            index=0,
+            help="Однозначные ответы жертвы правила оценивают всегда; последний ход диалога аналитик проверяет всегда"
+        )
         st.markdown("---")
 
         col1, col2 = st.columns(2)
         with col1:
-            start_btn = st.button("Запустить", type="primary", use_container_width=True)
+            start_btn = st.button("Запустить", type="primary", use_container_width=True, disabled=running)
         with col2:
             reset_btn = st.button("Сбросить", use_container_width=True)
 
         if reset_btn:
-            clear_history()
+            # A running simulation is not cancelled, it still finishes and is saved to the results store
+            st.session_state.run = None
+            st.query_params.clear()
             st.rerun()
 
+        resume_btn = fork_btn = False
+        fork_turn = None
+        if snapshot is not None and not running:
+            if snapshot["status"] == "failed":
+                resume_btn = st.button("Продолжить с места сбоя", use_container_width=True)
+            if snapshot["dialogue"]:
+                with st.expander("Ответвить диалог"):
+                    st.caption("Новая ветка продолжит диалог с выбранного сообщения с текущей жертвой "
+                               "и материалами, не генерируя начало заново")
+                    history_len = len(snapshot["dialogue"])
+                    fork_turn = st.number_input("После сообщения №", 1, history_len, history_len)
+                    fork_btn = st.button("Ответвить", use_container_width=True)
+
         st.markdown("---")
         st.subheader("Статус")
-        if st.session_state.simulation_running:
+        if snapshot is not None and snapshot["status"] == "queued":
+            st.info("Симуляция в очереди...")
+        elif running:
             st.info("Симуляция запущена...")
-        else:
-            if st.session_state.dialogue_history:
-                last_decision = st.session_state.analyst_history[-1][1] if st.session_state.analyst_history else None
-                if last_decision is True:
-                    st.success("Жертва разведена! 🚨")
-                elif last_decision is False:
-                    st.info("Жертва не разведена")
-                else:
-                    st.warning("Ожидание анализа...")
-            else:
-                st.info("Готов к запуску симуляции")
-
-    col1, col2 = st.columns([2, 1])
-
-    with col1:
-        st.subheader("💬 Диалог между мошенником и жертвой")
-        dialogue_container = st.empty()
-
-        with dialogue_container.container():
-            if st.session_state.dialogue_history:
-                for role, message, count in st.session_state.dialogue_history:
-                    # Use appropriate avatar based on current victim
-                    victim = victims[st.session_state.current_victim]
-                    avatar = "👵" if "женщина" in victim["bio"].lower() else "👴"
-
-                    with st.chat_message("assistant" if role == "scammer" else "user",
-                                         avatar="🦹‍♂️" if role == "scammer" else avatar):
-                        st.markdown(message)
-                        st.caption(f"Сообщение #{count}")
+        elif snapshot is not None and snapshot["dialogue"]:
+            last_decision = snapshot["verdicts"][-1][1] if snapshot["verdicts"] else None
+            if last_decision is True:
+                st.success("Жертва разведена! 🚨")
+            elif snapshot["outcome"] == "stalled":
+                st.warning("Диалог зациклился, жертва не разведена")
+            elif last_decision is False:
+                st.info("Жертва не разведена")
             else:
-                st.info("Диалог будет отображен здесь после запуска симуляции")
-
-    with col2:
-        st.subheader("🕵️‍♂️ Анализ мошеннической активности")
-        analyst_container = st.empty()
-
-        with analyst_container.container():
-            if st.session_state.analyst_history:
-                for idx, (analysis, is_scammed, count) in enumerate(st.session_state.analyst_history):
-                    with st.expander(f"Анализ после сообщения #{count}",
-                                     expanded=(idx == len(st.session_state.analyst_history) - 1)):
-                        st.markdown("**Результат анализа:**")
-                        st.markdown(f"> {analysis}")
-                        # Display decision with appropriate styling
-                        decision_class = "scammed" if is_scammed else "not-scammed"
-                        decision_text = "Жертва разведена! 🚨" if is_scammed else "Жертва не разведена"
-                        st.markdown(f'<div class="analyst-decision {decision_class}">{decision_text}</div>',
-                                    unsafe_allow_html=True)
-                        if is_scammed:
-                            st.success("Мошенничество успешно проведено!", icon="✅")
-                        else:
-                            st.info("Диалог продолжается...", icon="🔄")
-            else:
-                st.info("Анализ будет отображен здесь после запуска симуляции")
-
-    if start_btn and not st.session_state.simulation_running:
-        with st.spinner("Запуск симуляции..."):
-            generate_response(
-                fraud_cases[selected_case_key].description,
-                max_messages,
-                selected_case_key,
-                selected_victim_idx
-            )
+                st.warning("Ожидание анализа...")
+        else:
+            st.info("Готов к запуску симуляции")
+        load = run_manager().stats()
+        st.caption(f"На сервере: {load['running']} выполняется, {load['queued']} в очереди "
+                   f"(обработчиков: {run_manager().workers})")
+
+        with st.expander("📊 Метрики узлов"):
+            render_metrics()
+
+    panels = render_run(snapshot)
+    if running:
+        live_run(snapshot["run_id"], panels)
+
+    memory = MemoryConfig(window=memory_window) if use_memory else None
+    stall = StallConfig() if stop_stalled else None
+    schedule = ScheduleConfig(policy=SCHEDULE_OPTIONS[schedule_policy])
+    if start_btn and not running:
+        submit_run(max_messages, selected_case_key, selected_victim_idx, memory, selected_education,
+                   stall=stall, schedule=schedule)
+        st.rerun()
+    elif resume_btn:
+        run = st.session_state.run
+        submit_run(max_messages, run["case_name"], run["victim_index"], run["memory"], run["education"],
+                   mode="resume", stall=run["stall"], schedule=run["schedule"])
+        st.rerun()
+    elif fork_btn:
+        # A branch stays within the source case; victim, material and message limit come from the sidebar
+        submit_run(max_messages, st.session_state.run["case_name"], selected_victim_idx, memory, selected_education,
+                   mode="fork", fork_turn=int(fork_turn), stall=stall, schedule=schedule)
+        st.rerun()
 
 
 if __name__ == "__main__":
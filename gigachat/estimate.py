@@ -0,0 +1,165 @@
+import operator
+from collections import Counter
+from functools import lru_cache, partial
+from math import sqrt
+from statistics import NormalDist
+from typing import Annotated, List, Optional, TypedDict
+
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Send
+
+from graph import _fork_point, build_graph, make_inputs
+from src.utils import FraudCase, MemoryConfig, Role, ScheduleConfig, StallConfig
+
+
+class Rollout(TypedDict):
+    seed: int
+    is_scammed: bool
+    outcome: Optional[str]
+    message_count: int
+    error: Optional[str]
+
+
+class EstimateState(TypedDict):
+    prefix: dict  # DialogState values after an even turn (victim answered, analyst judged)
+    max_count: int
+    wave_size: int
+    max_rollouts: int
+    target_half_width: float
+    confidence: float
+    rollouts: Annotated[List[Rollout], operator.add]
+    estimate: dict
+
+
+def wilson_interval(successes: int, n: int, confidence: float):
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = successes / n
+    denom = 1 + z ** 2 / n
+    centre = (p + z ** 2 / (2 * n)) / denom
+    spread = z * sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denom
+    return max(0.0, centre - spread), min(1.0, centre + spread)
+
+
+def summarize_rollouts(rollouts: List[Rollout], confidence: float):
+    done = [r for r in rollouts if r["error"] is None]
+    scammed = [r for r in done if r["is_scammed"]]
+    low, high = wilson_interval(len(scammed), len(done), confidence)
+    turns = Counter(r["message_count"] for r in scammed)
+    return {
+        "n": len(done),
+        "errors": len(rollouts) - len(done),
+        "successes": len(scammed),
+        "stalled": sum(r["outcome"] == "stalled" for r in done),
+        "p": len(scammed) / len(done) if done else None,
+        "ci_low": low,
+        "ci_high": high,
+        "half_width": (high - low) / 2,
+        "turns_to_scam": dict(sorted(turns.items())),
+        "mean_turns_to_scam": sum(r["message_count"] for r in scammed) / len(scammed) if scammed else None,
+    }
+
+
+def _branch_inputs(state: EstimateState, seed: int):
+    return {**state["prefix"], "max_count": state["max_count"], "seed": seed}
+
+
+def _rollout_result(seed: int, final: Optional[dict] = None, error: Optional[Exception] = None):
+    if error is not None:
+        return {"rollouts": [Rollout(seed=seed, is_scammed=False, outcome=None, message_count=0,
+                                     error=f"{type(error).__name__}: {error}")]}
+    return {"rollouts": [Rollout(seed=seed, is_scammed=final.get("is_scammed", False), outcome=final.get("outcome"),
+                                 message_count=final["message_count"], error=None)]}
+
+
+def rollout(branch: dict, dialogue_graph):
+    try:
+        final = dialogue_graph.invoke(branch["inputs"], {"recursion_limit": 200})
+    except Exception as e:
+        return _rollout_result(branch["seed"], error=e)
+    return _rollout_result(branch["seed"], final)
+
+
+async def arollout(branch: dict, dialogue_graph):
+    try:
+        final = await dialogue_graph.ainvoke(branch["inputs"], {"recursion_limit": 200})
+    except Exception as e:
+        return _rollout_result(branch["seed"], error=e)
+    return _rollout_result(branch["seed"], final)
+
+
+def fan_out(state: EstimateState):
+    # One wave of independent continuations; seeds keep branches distinct (and distinct in the response cache)
+    start = len(state.get("rollouts", []))
+    size = min(state["wave_size"], state["max_rollouts"] - start)
+    return [Send("rollout", {"seed": seed, "inputs": _branch_inputs(state, seed)})
+            for seed in range(start, start + size)]
+
+
+def aggregate(state: EstimateState):
+    return {"estimate": summarize_rollouts(state["rollouts"], state["confidence"])}
+
+
+def decide_to_stop(state: EstimateState):
+    estimate = state["estimate"]
+    if len(state["rollouts"]) >= state["max_rollouts"]:
+        return "end"
+    if estimate["n"] > 0 and estimate["half_width"] <= state["target_half_width"]:
+        return "end"
+    return "continue"
+
+
+@lru_cache(maxsize=8)
+def _compile_estimator(dialogue_graph):
+    builder = StateGraph(EstimateState)
+    builder.add_node("plan", lambda state: {})
+    builder.add_node("rollout", RunnableLambda(partial(rollout, dialogue_graph=dialogue_graph),
+                                               afunc=partial(arollout, dialogue_graph=dialogue_graph)))
+    builder.add_node("aggregate", aggregate)
+
+    builder.add_edge(START, "plan")
+    builder.add_conditional_edges("plan", fan_out, ["rollout"])
+    builder.add_edge("rollout", "aggregate")
+    builder.add_conditional_edges("aggregate", decide_to_stop, {"end": END, "continue": "plan"})
+    return builder.compile()
+
+
+def build_estimator(case: FraudCase, victim: Role, memory: Optional[MemoryConfig] = None,
+                    stall: Optional[StallConfig] = None, schedule: Optional[ScheduleConfig] = None):
+    return _compile_estimator(build_graph(case, victim, memory=memory, stall=stall, schedule=schedule))
+
+
+def estimator_inputs(prefix: dict, max_count: int, wave_size: int = 8, max_rollouts: int = 64,
+                     target_half_width: float = 0.1, confidence: float = 0.95):
+    if prefix.get("message_count", 0) % 2:
+        raise ValueError("Rollouts continue with a scammer turn, the prefix must end after a victim turn")
+    return {
+        "prefix": prefix,
+        "max_count": max_count,
+        "wave_size": wave_size,
+        "max_rollouts": max_rollouts,
+        "target_half_width": target_half_width,
+        "confidence": confidence,
+        "rollouts": [],
+    }
+
+
+def prefix_from_thread(graph, thread_id: str, turn: int):
+    # Dialogue state after message #turn of a checkpointed run (see graph.fork_run)
+    values = dict(_fork_point(graph, thread_id, turn).values)
+    values.pop("seed", None)
+    return values
+
+
+async def estimate(case: FraudCase, victim: Role, max_count: int, prefix: Optional[dict] = None,
+                   memory: Optional[MemoryConfig] = None, stall: Optional[StallConfig] = None,
+                   schedule: Optional[ScheduleConfig] = None, **kwargs):
+    prefix = prefix or make_inputs(case, max_count)
+    estimator = build_estimator(case, victim, memory, stall, schedule)
+    result = await estimator.ainvoke(estimator_inputs(prefix, max_count, **kwargs))
+    return result["estimate"]
+
+
+# print(asyncio.run(estimate(investments, victims[0], max_count=10, target_half_width=0.1)))
@@ -1,147 +1,439 @@
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain_gigachat import GigaChat
-from src.config import GIGA_KEY
+import time
+from collections import Counter
+from functools import lru_cache, partial
+from uuid import uuid4
+
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import RunnableLambda
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from src.cache import enable_llm_cache
+from src.checkpoints import thread_config
+from src.metrics import record_call
+from src import config
+from src.config import get_giga_key
+from src.pool import PooledChatModel, RateLimiter
+from src.budget import parse_verdict, stop_sequences, trim_reply
+from src.prompts import analyst_prompt, person_prompt, summary_prompt
+from src.scheduling import analyst_due
+from src.stall import stall_update
 from src.utils import *
-from typing import Union
+from typing import Optional
 from src.roles_and_cases import *
-from copy import deepcopy
 
-credentials = GIGA_KEY
+GRAPH_CACHE_SIZE = 32
 
-chosen_case = deepcopy(secure_account)
-chosen_victim = 1
+# (case name, "scammed" | "not_scammed" | "llm") -> number of analyst turns settled that way
+fast_path_stats = Counter()
 
-scammer = chosen_case.profiles["scammer"]
-analyst = chosen_case.profiles["analyst"]
-victim = victims[chosen_victim]
+# (case name, "stalled" | "turns_saved") -> dialogues ended as stalled and the turns their early end spared
+stall_stats = Counter()
 
+# (case name, "judged" | "skipped") -> ambiguous victim turns sent to the LLM analyst or left for a later one
+schedule_stats = Counter()
 
-chat_template = ChatPromptTemplate.from_messages(
-    [
-        ("system", DEBATES_TEMPLATE),
-        ("user", "{history}"),
-    ]
-)
+# (role, "trimmed" | "kept") -> speaker replies cut at an extra turn or an unfinished sentence, or stored as they came
+trim_stats = Counter()
 
+# (case name, "used" | "wasted") -> speculative scammer turns kept or thrown away (see build_graph(speculative=True))
+speculation_stats = Counter()
 
-giga = GigaChat(credentials=credentials,
-                     scope="GIGACHAT_API_PERS",
-                     model="GigaChat-2",
-                     profanity_check=False,
-                     timeout=600,
-                     max_tokens=1000,
-                     verify_ssl_certs=False)
 
+_llm_model = None
 
-def _ask_person(state: DialogState, person: Role, opponent: Union[Role, None]):
-    pipe = chat_template | giga | StrOutputParser()
 
-    replicas = []
-    for m in state["messages"]:
-        if m.__class__ == HumanMessage:
-            replicas.append(f"{opponent['name']}: {m.content}")
-        else:
-            replicas.append(f"{person['name']}: {m.content}")
-    if len(replicas) == 0:
-        history = "Пока история пуста, ты начинаешь первым"
-    else:
-        history = "\n".join(replicas)
+def get_llm():
+    # One client per process: every node, batch worker and Streamlit session shares its connections,
+    # OAuth token and rate limits. Built on first use, so importing the graph needs neither the key,
+    # the settings nor the GigaChat SDK. The response cache (LLM_CACHE_MODE) is switched on with the client;
+    # a model passed to set_llm runs without it unless set_llm_cache is called
+    global _llm_model
+    if _llm_model is None:
+        from langchain_gigachat import GigaChat
 
-    resp = pipe.invoke(
-        {
-            "history": history,
-            "fraud_success": state["fraud_success"],
-            "fraud_scheme": state["fraud_scheme"],
-            "bio": person["bio"],
-            "bio2": opponent["bio"],
-            "name": person["name"],
-            "name2": opponent["name"],
-            "template": person["template"],
-        }
-    )
-    if not resp.startswith(person["name"]):
-        resp = f"{person['name']}: {resp}"
+        giga = GigaChat(credentials=get_giga_key(),
+                        scope="GIGACHAT_API_PERS",
+                        model="GigaChat-2",
+                        profanity_check=False,
+                        timeout=600,
+                        max_tokens=1000,
+                        verify_ssl_certs=False)
+        _llm_model = PooledChatModel(model=giga, limiter=RateLimiter(config.GIGA_RPS, config.GIGA_TPM),
+                                     max_retries=config.GIGA_MAX_RETRIES)
+        if config.LLM_CACHE_MODE != "off":
+            enable_llm_cache(config.LLM_CACHE_PATH, config.LLM_CACHE_MODE)
+    return _llm_model
 
-    return {
-        "messages": [resp],
-        "message_count": state.get("message_count", 0) + 1,
-    }
 
+def set_llm(model: BaseChatModel):
+    # Swap the chat model used by every node, e.g. for src.fake_llm.FakeChatModel in offline runs
+    global _llm_model
+    _llm_model = model
 
-def ask_scammer(state: DialogState):
-    return _ask_person(state, scammer, victim)
 
 
-def ask_victim(state: DialogState):
-    return _ask_person(state, victim, scammer)
+def _llm(state: DialogState, **generation):
+    # GigaChat has no sampling seed; binding it only makes repetitions distinct entries in the response cache.
+    # generation: per-role max_tokens and stop sequences (see BudgetConfig), unset ones keep the client defaults
+    return get_llm().bind(seed=state.get("seed", 0), **{k: v for k, v in generation.items() if v is not None})
 
 
-def ask_analyst(state: DialogState):
-    pipe = analyst_prompt | giga | StrOutputParser()
+def _history(state: DialogState):
+    # Turns before summary_upto are represented only by the running summary (see MemoryConfig)
+    upto = state.get("summary_upto", 0)
+    recent = render_transcript(state.get("transcript", []), start=upto)
+    if not state.get("summary"):
+        return recent
+    return f"Краткое содержание первых {upto} реплик: {state['summary']}\n\n{recent}"
 
-    history_lines = []
-    for m in state["messages"]:
-        if isinstance(m, HumanMessage):
-            history_lines.append(f"{victim['name']}: {m.content}")
-        elif isinstance(m, AIMessage):
-            history_lines.append(f"{scammer['name']}: {m.content}")
-        else:
-            history_lines.append(str(m))
-    history = "\n".join(history_lines)
 
-    result = pipe.invoke({
-        "bio": analyst["bio"],
-        "history": history,
-        "name": analyst["name"],
-        "template": analyst["template"],
-        "success_conditions": state["fraud_success"],
-    }).strip()
+def _person_inputs(state: DialogState):
+    # Everything else is already rendered into the prompt (see src.prompts)
+    return {"history": _history(state) or "Пока история пуста, ты начинаешь первым"}
+
+
+def _person_update(state: DialogState, role: str, person: Role, opponent: Role, message, seconds: float):
+    cut_off = message.response_metadata.get("finish_reason") == "length"
+    resp, trimmed = trim_reply(message.content, person, opponent, cut_off)
+    trim_stats[(role, "trimmed" if trimmed else "kept")] += 1
+    turn = make_turn(role, person["name"], resp)
+
+    return {
+        "transcript": [turn],
+        "message_count": state.get("message_count", 0) + 1,
+        "metrics": [record_call(role, seconds, message)],
+    }
 
+
+def _ask_person(state: DialogState, role: str, person: Role, opponent: Role, prompt: ChatPromptTemplate,
+                max_tokens: Optional[int] = None):
+    pipe = prompt | _llm(state, max_tokens=max_tokens, stop=stop_sequences(person, opponent))
+    started = time.perf_counter()
+    message = pipe.invoke(_person_inputs(state))
+    return _person_update(state, role, person, opponent, message, time.perf_counter() - started)
+
+
+async def _aask_person(state: DialogState, role: str, person: Role, opponent: Role, prompt: ChatPromptTemplate,
+                       max_tokens: Optional[int] = None):
+    pipe = prompt | _llm(state, max_tokens=max_tokens, stop=stop_sequences(person, opponent))
+    started = time.perf_counter()
+    message = await pipe.ainvoke(_person_inputs(state))
+    return _person_update(state, role, person, opponent, message, time.perf_counter() - started)
+
+
+def _analyst_update(state: DialogState, result: str, metric: NodeMetric, source: str = "llm"):
+    result = parse_verdict(result)
     is_scammed = result == "scammed"
 
     return {
         "analysis": result,
         "is_scammed": is_scammed,
+        "verdict_source": source,
+        "metrics": [metric],
+        "verdicts": [Verdict(turn=state.get("message_count", 0), analysis=result, is_scammed=is_scammed,
+                             source=source)],
+    }
+
+
+def _rule_verdict(state: DialogState, case: FraudCase):
+    if case.success_rules is None or not state["transcript"]:
+        return None
+
+    started = time.perf_counter()
+    verdict = case.success_rules.match(state["transcript"][-1]["text"])
+    if verdict is None:
+        fast_path_stats[(case.name, "llm")] += 1
+        return None
+    fast_path_stats[(case.name, "scammed" if verdict else "not_scammed")] += 1
+    metric = record_call("analyst", time.perf_counter() - started, source="rules")
+    return _analyst_update(state, "scammed" if verdict else "not scammed", metric, source="rules")
+
+
+def _round_end(state: DialogState, update: dict, case: FraudCase, stall: Optional[StallConfig]):
+    # Stall tracking and the outcome are settled with the verdict, right before decide_to_stop reads them
+    stopped = False
+    if stall is not None:
+        tracker = stall_update(state.get("stall"), state["transcript"][-2:], update["is_scammed"], stall)
+        stopped = tracker.pop("stalled") and not update["is_scammed"]
+        update = {**update, "stall": tracker, "is_stopped": stopped}
+
+    if update["is_scammed"]:
+        outcome = "scammed"
+    elif stopped:
+        outcome = "stalled"
+        stall_stats[(case.name, "stalled")] += 1
+        stall_stats[(case.name, "turns_saved")] += max(0, state.get("max_count", 20) - state.get("message_count", 0))
+    elif state.get("message_count", 0) >= state.get("max_count", 20):
+        outcome = "max_count"
+    else:
+        outcome = None
+    return {**update, "outcome": outcome}
+
+
+def _scheduled_verdict(state: DialogState, case: FraudCase, schedule: Optional[ScheduleConfig],
+                       stall: Optional[StallConfig]):
+    # None when the LLM analyst has to judge this turn, otherwise an update without a verdict
+    if analyst_due(state, case, schedule, stall):
+        if schedule is not None:
+            schedule_stats[(case.name, "judged")] += 1
+        return None
+    schedule_stats[(case.name, "skipped")] += 1
+    return {"is_scammed": state.get("is_scammed", False)}
+
+
+def ask_analyst(state: DialogState, case: FraudCase, prompt: ChatPromptTemplate,
+                stall: Optional[StallConfig] = None, schedule: Optional[ScheduleConfig] = None,
+                max_tokens: Optional[int] = None):
+    if (update := _rule_verdict(state, case) or _scheduled_verdict(state, case, schedule, stall)) is None:
+        pipe = prompt | _llm(state, max_tokens=max_tokens)
+        started = time.perf_counter()
+        message = pipe.invoke({"history": _history(state)})
+        update = _analyst_update(state, message.content,
+                                 record_call("analyst", time.perf_counter() - started, message))
+    return _round_end(state, update, case, stall)
+
+
+async def aask_analyst(state: DialogState, case: FraudCase, prompt: ChatPromptTemplate,
+                       stall: Optional[StallConfig] = None, schedule: Optional[ScheduleConfig] = None,
+                       max_tokens: Optional[int] = None):
+    if (update := _rule_verdict(state, case) or _scheduled_verdict(state, case, schedule, stall)) is None:
+        pipe = prompt | _llm(state, max_tokens=max_tokens)
+        started = time.perf_counter()
+        message = await pipe.ainvoke({"history": _history(state)})
+        update = _analyst_update(state, message.content,
+                                 record_call("analyst", time.perf_counter() - started, message))
+    return _round_end(state, update, case, stall)
+
+
+def _summary_inputs(state: DialogState, memory: MemoryConfig):
+    upto = len(state["transcript"]) - memory.window
+    return upto, {
+        "summary": state.get("summary") or "Пока пусто",
+        "history": render_transcript(state["transcript"], start=state.get("summary_upto", 0), end=upto),
+    }
+
+
+def _summary_update(upto: int, message, seconds: float):
+    return {
+        "summary": message.content.strip(),
+        "summary_upto": upto,
+        "metrics": [record_call("summarize", seconds, message)],
     }
 
 
+def summarize(state: DialogState, memory: MemoryConfig, prompt: ChatPromptTemplate,
+              max_tokens: Optional[int] = None):
+    upto, inputs = _summary_inputs(state, memory)
+    pipe = prompt | _llm(state, max_tokens=max_tokens)
+    started = time.perf_counter()
+    message = pipe.invoke(inputs)
+    return _summary_update(upto, message, time.perf_counter() - started)
+
+
+async def asummarize(state: DialogState, memory: MemoryConfig, prompt: ChatPromptTemplate,
+                     max_tokens: Optional[int] = None):
+    upto, inputs = _summary_inputs(state, memory)
+    pipe = prompt | _llm(state, max_tokens=max_tokens)
+    started = time.perf_counter()
+    message = await pipe.ainvoke(inputs)
+    return _summary_update(upto, message, time.perf_counter() - started)
+
+
+def _needs_summary(state: DialogState, memory: Optional[MemoryConfig]):
+    if memory is None:
+        return False
+    return len(state["transcript"]) - state.get("summary_upto", 0) >= memory.window + memory.every
+
+
 def decide_to_stop(state: DialogState):
     if state.get("message_count", 0) >= state.get("max_count", 20):
         return "end"
 
-    if state.get("is_scammed", False):
+    if state.get("is_scammed", False) or state.get("is_stopped", False):
         return "end"
     else:
         return "continue"
 
 
-builder = StateGraph(DialogState)
+def speculate(state: DialogState, scammer: Role, victim: Role, prompt: ChatPromptTemplate,
+              max_tokens: Optional[int] = None):
+    return {"speculative": _ask_person(state, "scammer", scammer, victim, prompt, max_tokens)}
+
+
+async def aspeculate(state: DialogState, scammer: Role, victim: Role, prompt: ChatPromptTemplate,
+                     max_tokens: Optional[int] = None):
+    return {"speculative": await _aask_person(state, "scammer", scammer, victim, prompt, max_tokens)}
+
+
+def commit(state: DialogState, case: FraudCase):
+    # Joins the analyst with the scammer turn generated in parallel to it: the turn only enters the dialogue
+    # if the analyst let it continue, otherwise the call was wasted
+    if decide_to_stop(state) == "end":
+        speculation_stats[(case.name, "wasted")] += 1
+        return {"speculative": None}
+    speculation_stats[(case.name, "used")] += 1
+    return {**state["speculative"], "speculative": None}
 
-builder.add_node("Скам Скамыч", ask_scammer)
-builder.add_node(victim["name"], ask_victim)
-builder.add_node("analyst", ask_analyst)
 
-builder.add_edge(START, "Скам Скамыч")
-builder.add_edge("Скам Скамыч", victim["name"])
-builder.add_edge(victim["name"], "analyst")
+def _route_speculative(state: DialogState, memory: Optional[MemoryConfig]):
+    if state["transcript"][-1]["role"] != "scammer":
+        return "end"
+    return "summarize" if _needs_summary(state, memory) else "continue"
+
+
+def _node(func, afunc, **roles):
+    # Nodes work both under graph.stream (Streamlit) and graph.astream/ainvoke (batch runs)
+    return RunnableLambda(partial(func, **roles), afunc=partial(afunc, **roles))
+
+
+def _role_key(role: Role):
+    return tuple(sorted(role.items()))
+
+
+def _route(state: DialogState, memory: Optional[MemoryConfig]):
+    decision = decide_to_stop(state)
+    if decision == "continue" and _needs_summary(state, memory):
+        return "summarize"
+    return decision
+
+
+def build_graph(case: FraudCase, victim: Role, analyst: Optional[Role] = None,
+                memory: Optional[MemoryConfig] = None, checkpointer: Optional[BaseCheckpointSaver] = None,
+                speculative: bool = False, stall: Optional[StallConfig] = None,
+                schedule: Optional[ScheduleConfig] = None, budget: Optional[BudgetConfig] = None):
+    # Each (case, victim, analyst, memory, checkpointer, speculative, stall, schedule, budget) combination is
+    # compiled once and shared by all runs and sessions.
+    # Output budgets always apply, BudgetConfig() unless given.
+    # With a StallConfig the analyst also ends dialogues that keep repeating themselves (outcome "stalled").
+    # With a ScheduleConfig the LLM analyst only judges the turns its policy picks, plus the final one.
+    # With speculative=True the next scammer turn is generated while the analyst judges the victim's answer,
+    # taking the analyst off the critical path at the cost of one wasted call per finished dialogue
+    analyst = analyst or case.profiles["analyst"]
+    return _compile_graph(case.model_dump_json(), _role_key(victim), _role_key(analyst),
+                          memory.model_dump_json() if memory else None, checkpointer, speculative,
+                          stall.model_dump_json() if stall else None,
+                          schedule.model_dump_json() if schedule else None,
+                          (budget or BudgetConfig()).model_dump_json())
+
+
+@lru_cache(maxsize=GRAPH_CACHE_SIZE)
+def _compile_graph(case_key: str, victim_key: tuple, analyst_key: tuple, memory_key: Optional[str],
+                   checkpointer: Optional[BaseCheckpointSaver], speculative: bool = False,
+                   stall_key: Optional[str] = None, schedule_key: Optional[str] = None,
+                   budget_key: Optional[str] = None):
+    case = FraudCase.model_validate_json(case_key)
+    victim = Role(**dict(victim_key))
+    analyst = Role(**dict(analyst_key))
+    memory = MemoryConfig.model_validate_json(memory_key) if memory_key else None
+    stall = StallConfig.model_validate_json(stall_key) if stall_key else None
+    schedule = ScheduleConfig.model_validate_json(schedule_key) if schedule_key else None
+    budget = BudgetConfig.model_validate_json(budget_key) if budget_key else BudgetConfig()
+    scammer = case.profiles["scammer"]
+    # Rendered and validated once here; per call only the history is filled in
+    scammer_prompt = person_prompt(case, scammer, victim)
+
+    builder = StateGraph(DialogState)
+
+    builder.add_node(scammer["name"], _node(_ask_person, _aask_person, role="scammer", person=scammer,
+                                            opponent=victim, prompt=scammer_prompt, max_tokens=budget.scammer))
+    builder.add_node(victim["name"], _node(_ask_person, _aask_person, role="victim", person=victim, opponent=scammer,
+                                           prompt=person_prompt(case, victim, scammer), max_tokens=budget.victim))
+    builder.add_node("analyst", _node(ask_analyst, aask_analyst, case=case, prompt=analyst_prompt(case, analyst),
+                                      stall=stall, schedule=schedule, max_tokens=budget.analyst))
+    if memory is not None:
+        builder.add_node("summarize", _node(summarize, asummarize, memory=memory,
+                                            prompt=summary_prompt(scammer, victim), max_tokens=budget.summarize))
+        builder.add_edge("summarize", victim["name"] if speculative else scammer["name"])
+
+    builder.add_edge(START, scammer["name"])
+    builder.add_edge(scammer["name"], victim["name"])
+    builder.add_edge(victim["name"], "analyst")
+
+    if speculative:
+        builder.add_node("speculate", _node(speculate, aspeculate, scammer=scammer, victim=victim,
+                                            prompt=scammer_prompt, max_tokens=budget.scammer))
+        builder.add_node("commit", partial(commit, case=case))
+        builder.add_edge(victim["name"], "speculate")
+        builder.add_edge(["analyst", "speculate"], "commit")
+        builder.add_conditional_edges(
+            "commit",
+            partial(_route_speculative, memory=memory),
+            {
+                "end": END,
+                "continue": victim["name"],
+                "summarize": "summarize" if memory is not None else victim["name"],
+            },
+        )
+        return builder.compile(checkpointer=checkpointer)
+
+    builder.add_conditional_edges(
+        "analyst",
+        partial(_route, memory=memory),
+        {
+            "end": END,
+            "continue": scammer["name"],
+            "summarize": "summarize" if memory is not None else scammer["name"],
+        },
+    )
+
+    return builder.compile(checkpointer=checkpointer)
+
+
+def make_inputs(case: FraudCase, max_count: int, seed: int = 0):
+    return {
+        "fraud_scheme": case.description,
+        "fraud_success": case.success_condition,
+        "transcript": [],
+        "metrics": [],
+        "verdicts": [],
+        "summary": "",
+        "summary_upto": 0,
+        "message_count": 0,
+        "max_count": max_count,
+        "seed": seed,
+    }
+
+
+def _fork_point(graph, thread_id: str, turn: int):
+    # The latest checkpoint taken right after message #turn was written and, for victim turns, judged by the analyst
+    for snapshot in graph.get_state_history(thread_config(thread_id)):
+        if snapshot.values.get("message_count") == turn and "analyst" not in snapshot.next:
+            return snapshot
+    raise ValueError(f"Thread {thread_id!r} has no checkpoint after message #{turn}")
+
+
+def fork_run(graph, thread_id: str, turn: int, target_graph=None, new_thread_id: Optional[str] = None,
+             **overrides):
+    # Copies the state after message #turn into a new thread of target_graph (e.g. built for another victim
+    # or with educational material), so the shared prefix is reused instead of regenerated.
+    # Continue the branch with target_graph.stream(None, thread_config(new_thread_id)).
+    target_graph = target_graph or graph
+    new_thread_id = new_thread_id or str(uuid4())
+    values = {**_fork_point(graph, thread_id, turn).values, "speculative": None, "is_stopped": False,
+              "outcome": None, **overrides}
+    # Turns are stored rendered as "Name: text", so the victim's lines are rendered again with the name of
+    # target_graph's victim; otherwise the prompts, stop sequences and trimming would see two different victims
+    scammer = next(dst for src, dst in target_graph.builder.edges if src == START)
+    victim = next(dst for src, dst in target_graph.builder.edges if src == scammer)
+    transcript = [make_turn("victim", victim, t["text"]) if t["role"] == "victim" else t
+                  for t in values.get("transcript", [])]
+    values["transcript"] = transcript
+    if turn % 2 == 0 and "commit" in target_graph.nodes:
+        # A speculative graph has no static edge out of the analyst, so the victim's turn is judged again
+        as_node = next(src for src, dst in target_graph.builder.edges if dst == "speculate")
+    elif turn % 2 == 0:
+        as_node = "analyst"
+    else:
+        as_node = scammer
+    target_graph.update_state(thread_config(new_thread_id), values, as_node=as_node)
+    return new_thread_id
 
-builder.add_conditional_edges(
-    "analyst",
-    decide_to_stop,
-    {
-        "end": END,
-        "continue": "Скам Скамыч",
-    },
-)
 
-graph = builder.compile()
+def resume_run(graph, thread_id: str):
+    # Picks up an interrupted run (e.g. after a GigaChat timeout) from its last checkpoint
+    return graph.stream(None, thread_config(thread_id), stream_mode="updates")
 
 
-# inputs = {
-#     "fraud_scheme": chosen_case.description,
-#     "fraud_success": chosen_case.success_condition,
-# }
-# for output in graph.stream(inputs, stream_mode="updates"):
-#     print(output)
\ No newline at end of file
+# graph = build_graph(secure_account, victims[1])
+# for output in graph.stream(make_inputs(secure_account, 10), stream_mode="updates"):
+#     print(output)
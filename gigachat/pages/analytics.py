@@ -0,0 +1,119 @@
+from datetime import date
+
+import streamlit as st
+from src.roles_and_cases import cases, victims
+from src.store import dataset, dialogue_totals, load_messages, make_filter, success_by_turn
+
+st.set_page_config(
+    page_title="Fraud Simulation Analytics",
+    page_icon="📈",
+    layout="wide",
+)
+
+# Every query goes to the Parquet files with the filters attached, so only matching partitions and
+# columns are read; results are cached briefly because new runs keep arriving
+CACHE_TTL = 30
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_success(filters):
+    return success_by_turn(**dict(filters)).to_pandas()
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_totals(filters):
+    return dialogue_totals(**dict(filters)).to_pandas()
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_recent_runs(filters, limit=50):
+    data = dataset("dialogues")
+    if data is None:
+        return []
+    table = data.to_table(columns=["run_id", "created", "case", "victim", "is_scammed", "message_count"],
+                          filter=make_filter(**dict(filters)))
+    return table.sort_by([("created", "descending")]).slice(0, limit).to_pylist()
+
+
+@st.cache_data(ttl=CACHE_TTL)
+def load_transcript(run_id, case):
+    return load_messages(run_ids=[run_id], cases=[case]).sort_by("turn").to_pylist()
+
+
+def main():
+    st.title("📈 Аналитика симуляций")
+
+    with st.sidebar:
+        st.header("Фильтры")
+        selected_cases = st.multiselect("Схемы", options=list(cases), format_func=lambda key: cases[key].name)
+        selected_victims = st.multiselect("Жертвы", options=[v["name"] for v in victims.values()])
+        use_dates = st.checkbox("Ограничить период")
+        since = until = None
+        if use_dates:
+            period = st.date_input("Период", value=(date.today(), date.today()))
+            # While the range is being picked only its start is set
+            since, until = period if len(period) == 2 else (period[0], period[0])
+            since, until = since.isoformat(), until.isoformat()
+
+    # Hashable for st.cache_data
+    filters = (("cases", tuple(selected_cases)), ("victims", tuple(selected_victims)),
+               ("since", since), ("until", until))
+
+    totals = load_totals(filters)
+    if totals.empty:
+        st.info("Пока нет сохраненных диалогов. Запустите симуляцию или пакетный прогон.")
+        return
+
+    dialogues = int(totals["count_all"].sum())
+    scammed = float((totals["is_scammed_mean"] * totals["count_all"]).sum() / dialogues)
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Диалогов", f"{dialogues:,}".replace(",", " "))
+    col2.metric("Доля успешных схем", f"{scammed:.1%}")
+    col3.metric("Токенов", f"{int(totals['prompt_tokens_sum'].sum() + totals['completion_tokens_sum'].sum()):,}"
+                .replace(",", " "))
+    col4.metric("Стоимость, ₽", f"{totals['cost_sum'].sum():.2f}")
+
+    st.subheader("Доля разведенных жертв к сообщению №")
+    success = load_success(filters)
+    if success.empty:
+        st.caption("Ни одна жертва не была разведена")
+    else:
+        success["Серия"] = success["case"].map(lambda key: cases[key].name if key in cases else key) \
+            + " / " + success["victim"]
+        chart = success.pivot_table(index="turn", columns="Серия", values="rate").sort_index().ffill()
+        st.line_chart(chart)
+
+    st.subheader("Сводка по схемам и жертвам")
+    st.dataframe(
+        totals.rename(columns={
+            "case": "Схема",
+            "victim": "Жертва",
+            "count_all": "Диалогов",
+            "is_scammed_mean": "Доля успеха",
+            "message_count_mean": "Сообщений в среднем",
+            "seconds_mean": "Время LLM, с",
+            "prompt_tokens_sum": "Токены запросов",
+            "completion_tokens_sum": "Токены ответов",
+            "cost_sum": "Стоимость, ₽",
+        }),
+        hide_index=True,
+    )
+
+    st.subheader("Последние диалоги")
+    runs = load_recent_runs(filters)
+    labels = {
+        run["run_id"]: f"{run['created']:%Y-%m-%d %H:%M} · {run['victim']} · "
+                       f"{'разведена' if run['is_scammed'] else 'не разведена'} · {run['message_count']} сообщ."
+        for run in runs
+    }
+    run_id = st.selectbox("Диалог", options=list(labels), format_func=labels.get)
+    if run_id:
+        case = next(run["case"] for run in runs if run["run_id"] == run_id)
+        for row in load_transcript(run_id, case):
+            with st.chat_message("assistant" if row["role"] == "scammer" else "user"):
+                st.markdown(row["text"])
+                if row["verdict"]:
+                    st.caption(f"Аналитик: {row['verdict']}")
+
+
+main()
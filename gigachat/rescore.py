@@ -0,0 +1,231 @@
+import argparse
+import asyncio
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from graph import get_llm
+from src.budget import parse_verdict
+from src import config
+from src.roles_and_cases import cases
+from src.store import load_messages, write_rows
+from src.prompts import analyst_prompt, analyst_system
+from src.utils import BudgetConfig, FraudCase
+
+# Replays only the analyst over transcripts already in the results store, with the analyst template and
+# success condition as they are in roles_and_cases now. New verdicts go to the "rescored" dataset next to
+# the old ones, one partition per scorer name, so several prompt variants can be compared side by side.
+#   rules  - SuccessRules only, turns they cannot settle stay undecided
+#   llm    - every victim turn goes to the analyst
+#   hybrid - rules first, the analyst only for ambiguous turns (what the live graph does)
+
+MODES = ("rules", "llm", "hybrid")
+
+batch_prompt = ChatPromptTemplate.from_template(
+    """
+{template}
+
+Ниже {count} переписок, реплики в них пронумерованы.
+Для каждой реплики из списка «Оцени» реши отдельно, разведена ли жертва к этому моменту,
+учитывая только переписку до этой реплики включительно.
+Ответь строго по одной строке на реплику, без пояснений, в формате
+<номер переписки>.<номер реплики>: scammed
+или
+<номер переписки>.<номер реплики>: not scammed
+
+{dialogues}
+
+Оцени: {items}
+"""
+)
+
+ANSWER = re.compile(r"^\s*(\d+)\.(\d+)\s*:\s*(not scammed|scammed)\b", re.IGNORECASE | re.MULTILINE)
+
+
+def analyst_template(case: FraudCase):
+    return analyst_system(case, case.profiles["analyst"])
+
+
+def load_dialogues(root: Optional[str] = None, **filters):
+    # run_id -> case, victim, date and the turns in order
+    table = load_messages(root, **filters)
+    table = table.select(["run_id", "case", "victim", "date", "turn", "role", "text", "verdict", "is_scammed"])
+    dialogues = {}
+    for row in table.sort_by([("run_id", "ascending"), ("turn", "ascending")]).to_pylist():
+        dialogue = dialogues.setdefault(row["run_id"], {key: row[key] for key in ("case", "victim", "date")}
+                                        | {"turns": []})
+        dialogue["turns"].append(row)
+    return dialogues
+
+
+def _lines(dialogue: dict, upto: Optional[int] = None, numbered: bool = False):
+    scammer = cases[dialogue["case"]].profiles["scammer"]["name"]
+    lines = []
+    for turn in dialogue["turns"]:
+        if upto is not None and turn["turn"] > upto:
+            break
+        name = scammer if turn["role"] == "scammer" else dialogue["victim"]
+        prefix = f"{turn['turn']}. " if numbered else ""
+        lines.append(f"{prefix}{name}: {turn['text']}")
+    return "\n".join(lines)
+
+
+def _verdict(run_id: str, dialogue: dict, turn: dict, verdict: Optional[str], source: str, scorer: str):
+    return {
+        "run_id": run_id,
+        "victim": dialogue["victim"],
+        "turn": turn["turn"],
+        "old_verdict": turn["verdict"],
+        "old_is_scammed": turn["is_scammed"],
+        "verdict": verdict,
+        "is_scammed": None if verdict is None else verdict == "scammed",
+        "source": source,
+        "scorer": scorer,
+        "case": dialogue["case"],
+        "date": dialogue["date"],
+    }
+
+
+class Rescorer:
+    def __init__(self, scorer: str, mode: str = "hybrid", per_request: int = 4, concurrency: int = 16):
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {MODES}")
+        self.scorer = scorer
+        self.mode = mode
+        self.per_request = per_request
+        self.concurrency = concurrency
+        self.stats = defaultdict(int)
+
+    def rule_pass(self, dialogues: Dict[str, dict]):
+        # Returns verdict rows settled without the LLM and (run_id, turn) pairs left for the analyst
+        rows, pending = [], defaultdict(list)
+        for run_id, dialogue in dialogues.items():
+            rules = cases[dialogue["case"]].success_rules
+            for turn in dialogue["turns"]:
+                if turn["role"] != "victim":
+                    continue
+                match = rules.match(turn["text"]) if rules is not None and self.mode != "llm" else None
+                if match is not None:
+                    rows.append(_verdict(run_id, dialogue, turn, "scammed" if match else "not scammed",
+                                         "rules", self.scorer))
+                elif self.mode == "rules":
+                    rows.append(_verdict(run_id, dialogue, turn, None, "rules", self.scorer))
+                else:
+                    pending[run_id].append(turn)
+        self.stats["rules"] += sum(row["verdict"] is not None for row in rows)
+        self.stats["undecided"] += sum(row["verdict"] is None for row in rows)
+        return rows, pending
+
+    async def _ask_single(self, run_id: str, dialogue: dict, turn: dict):
+        # Same prompt the live analyst node sends, used when a batched answer misses a turn
+        case = cases[dialogue["case"]]
+        llm = get_llm().bind(max_tokens=BudgetConfig().analyst)
+        message = await (analyst_prompt(case) | llm).ainvoke({"history": _lines(dialogue, upto=turn["turn"])})
+        self.stats["single_requests"] += 1
+        return _verdict(run_id, dialogue, turn, parse_verdict(message.content), "llm", self.scorer)
+
+    async def _ask_batch(self, case_key: str, chunk: List[tuple]):
+        # chunk: [(run_id, dialogue, [victim turns to judge])], all of one case
+        case = cases[case_key]
+        texts, items = [], []
+        for i, (run_id, dialogue, turns) in enumerate(chunk, start=1):
+            texts.append(f"Переписка {i}:\n{_lines(dialogue, upto=turns[-1]['turn'], numbered=True)}")
+            items.extend(f"{i}.{turn['turn']}" for turn in turns)
+        message = await (batch_prompt | get_llm()).ainvoke({
+            "template": analyst_template(case),
+            "count": len(chunk),
+            "dialogues": "\n\n".join(texts),
+            "items": ", ".join(items),
+        })
+        self.stats["batch_requests"] += 1
+
+        answers = {(int(d), int(t)): v.lower() for d, t, v in ANSWER.findall(message.content)}
+        rows, missing = [], []
+        for i, (run_id, dialogue, turns) in enumerate(chunk, start=1):
+            for turn in turns:
+                verdict = answers.get((i, turn["turn"]))
+                if verdict is None:
+                    missing.append((run_id, dialogue, turn))
+                else:
+                    rows.append(_verdict(run_id, dialogue, turn, verdict, "llm", self.scorer))
+        rows.extend(await asyncio.gather(*(self._ask_single(*item) for item in missing)))
+        return rows
+
+    async def llm_pass(self, dialogues: Dict[str, dict], pending: Dict[str, List[dict]]):
+        by_case = defaultdict(list)
+        for run_id, turns in pending.items():
+            by_case[dialogues[run_id]["case"]].append((run_id, dialogues[run_id], turns))
+        chunks = [(case_key, items[i:i + self.per_request])
+                  for case_key, items in by_case.items() for i in range(0, len(items), self.per_request)]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(case_key, chunk):
+            async with semaphore:
+                return await self._ask_batch(case_key, chunk)
+
+        rows = [row for result in await asyncio.gather(*(run(*c) for c in chunks)) for row in result]
+        self.stats["llm"] += len(rows)
+        return rows
+
+    async def rescore(self, dialogues: Dict[str, dict]):
+        rows, pending = self.rule_pass(dialogues)
+        if pending:
+            rows.extend(await self.llm_pass(dialogues, pending))
+        return rows
+
+
+def compare(rows: Iterable[dict]):
+    rows = [r for r in rows if r["verdict"] is not None]
+    agree = sum(r["is_scammed"] == bool(r["old_is_scammed"]) for r in rows if r["old_verdict"] is not None)
+    judged_before = sum(r["old_verdict"] is not None for r in rows)
+    old_outcome, new_outcome = defaultdict(bool), defaultdict(bool)
+    for r in rows:
+        old_outcome[r["run_id"]] |= bool(r["old_is_scammed"])
+        new_outcome[r["run_id"]] |= r["is_scammed"]
+    return {
+        "turns": len(rows),
+        "agreement": agree / judged_before if judged_before else None,
+        "dialogues": len(new_outcome),
+        "scammed_before": sum(old_outcome.values()),
+        "scammed_now": sum(new_outcome.values()),
+        "flipped": sum(old_outcome[r] != new_outcome[r] for r in new_outcome),
+    }
+
+
+async def rescore_store(scorer: str, mode: str = "hybrid", root: Optional[str] = None, per_request: int = 4,
+                        concurrency: int = 16, **filters):
+    started = time.perf_counter()
+    dialogues = load_dialogues(root, **filters)
+    rescorer = Rescorer(scorer, mode, per_request, concurrency)
+    rows = await rescorer.rescore(dialogues)
+    if rows:
+        write_rows(root or config.RESULTS_PATH, "rescored", rows)
+    return {**rescorer.stats, **compare(rows), "elapsed": time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored dialogues with the current analyst")
+    parser.add_argument("scorer", help="name of this verdict set, e.g. the prompt version")
+    parser.add_argument("--mode", choices=MODES, default="hybrid")
+    parser.add_argument("--root", help="results store, default RESULTS_PATH")
+    parser.add_argument("--cases", nargs="+", choices=list(cases))
+    parser.add_argument("--victims", nargs="+")
+    parser.add_argument("--since", help="YYYY-MM-DD")
+    parser.add_argument("--until", help="YYYY-MM-DD")
+    parser.add_argument("--per-request", type=int, default=4, help="dialogues judged in one analyst request")
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    summary = asyncio.run(rescore_store(args.scorer, args.mode, args.root, args.per_request, args.concurrency,
+                                        cases=args.cases, victims=args.victims, since=args.since,
+                                        until=args.until))
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
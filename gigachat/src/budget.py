@@ -0,0 +1,42 @@
+import re
+from typing import List, Tuple
+
+from .models import Role
+
+# Post-processing of generated replies. A speaker asked for one short turn often goes on to write the other
+# side's lines as well; those would end up in the transcript and in every later prompt. The stop sequences
+# end generation at the first "Name:" of a new turn where the API supports it, trim_reply cuts whatever
+# still comes through.
+
+SENTENCE_END = re.compile(r"[.!?…»\"')]\s")
+VERDICT_WORD = re.compile(r"\w+")
+
+
+def stop_sequences(person: Role, opponent: Role) -> List[str]:
+    # The speaker's own name only counts at the start of a new line: replies may open with it
+    return [f"{opponent['name']}:", f"\n{person['name']}:"]
+
+
+def trim_reply(text: str, person: Role, opponent: Role, cut_off: bool = False) -> Tuple[str, bool]:
+    # Returns the reply without the speaker's name prefix and anything from the next turn on, and whether
+    # something was cut. cut_off: generation hit max_tokens, so the unfinished last sentence is dropped too
+    text = text.strip()
+    if text.startswith(person["name"]):
+        text = text[len(person["name"]):].lstrip(": ")
+    end = len(text)
+    for marker in stop_sequences(person, opponent):
+        found = text.find(marker)
+        # A reply that is nothing but the other side's line is kept rather than emptied
+        if found > 0:
+            end = min(end, found)
+    if cut_off and end == len(text):
+        sentences = list(SENTENCE_END.finditer(text + " "))
+        if sentences:
+            end = sentences[-1].start() + 1
+    return text[:end].rstrip(), end < len(text)
+
+
+def parse_verdict(text: str) -> str:
+    # The analyst answers with one word; anything but "scammed" first counts as "not scammed"
+    word = VERDICT_WORD.search(text)
+    return "scammed" if word and word.group(0).lower() == "scammed" else "not scammed"
@@ -0,0 +1,140 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Optional
+
+from langchain_core._api import LangChainBetaWarning
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+warnings.filterwarnings("ignore", message=r"The function `loads` is in beta", category=LangChainBetaWarning)
+
+CACHE_MODES = ("readwrite", "replay")
+
+
+class CacheMiss(KeyError):
+    pass
+
+
+class SQLiteLLMCache(BaseCache):
+    # Content-addressed response cache shared by every chat model call in the process.
+    # llm_string already carries the model name and generation params (including bound kwargs such
+    # as the repetition seed), prompt is the fully rendered message list.
+    # mode="replay" never writes and raises CacheMiss instead of letting a call reach the API.
+
+    def __init__(self, path: str = "llm_cache.sqlite", max_entries: int = 100_000,
+                 max_bytes: Optional[int] = None, mode: str = "readwrite"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._entries, self._bytes = self._totals()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str):
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _totals(self):
+        entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return entries, size
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.make_key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.mode == "readwrite":
+                self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            if self.mode == "replay":
+                raise CacheMiss(f"No cached response for {key} in {self.path}")
+            return None
+        generations = loads(row[0])
+        for generation in generations:
+            # Marks the hit for src.metrics; the stored retry count belonged to the original call
+            generation.message.response_metadata = {**generation.message.response_metadata,
+                                                    "cache_hit": True, "retries": 0}
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.mode != "readwrite":
+            return
+        key = self.make_key(prompt, llm_string)
+        value = dumps(list(return_val), ensure_ascii=False)
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            if old is None:
+                self._entries += 1
+                self._bytes += size
+            else:
+                self._bytes += size - old[0]
+            if self._over_limit():
+                self._evict()
+
+    def _over_limit(self):
+        return self._entries > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes)
+
+    def _evict(self):
+        # Other processes may share the file, so re-read the totals before deleting anything.
+        # Evicting a tenth of the budget at once keeps inserts near the limit from paying for a DELETE each.
+        self._entries, self._bytes = self._totals()
+        while self._over_limit():
+            batch = max(1, self.max_entries // 10)
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used LIMIT ?)",
+                (batch,),
+            )
+            self._entries, self._bytes = self._totals()
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._entries, self._bytes = 0, 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": self._entries,
+            "bytes": self._bytes,
+            "mode": self.mode,
+        }
+
+
+def enable_llm_cache(path: str = "llm_cache.sqlite", mode: str = "readwrite", **kwargs):
+    cache = SQLiteLLMCache(path, mode=mode, **kwargs)
+    set_llm_cache(cache)
+    return cache
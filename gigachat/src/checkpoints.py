@@ -0,0 +1,32 @@
+import sqlite3
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from . import config
+
+
+def get_checkpointer(path: Optional[str] = None) -> SqliteSaver:
+    # path defaults to CHECKPOINT_PATH, read on the first call rather than at import
+    return _checkpointer(path or config.CHECKPOINT_PATH)
+
+
+@lru_cache(maxsize=None)
+def _checkpointer(path: str) -> SqliteSaver:
+    # One saver per file and process; Streamlit script threads share it (SqliteSaver locks internally)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    return SqliteSaver(conn)
+
+
+@asynccontextmanager
+async def async_checkpointer(path: Optional[str] = None):
+    # aiosqlite connections belong to the running event loop, so async runs open their own saver
+    async with AsyncSqliteSaver.from_conn_string(path or config.CHECKPOINT_PATH) as saver:
+        yield saver
+
+
+def thread_config(thread_id: str, recursion_limit: int = 100):
+    return {"recursion_limit": recursion_limit, "configurable": {"thread_id": thread_id}}
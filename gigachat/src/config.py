@@ -1,8 +1,63 @@
 import os
-from dotenv import load_dotenv
+from functools import lru_cache
 
-load_dotenv()
 
-GIGA_KEY = os.getenv('GIGA_KEY')
-if not GIGA_KEY:
-    raise ValueError("GIGA_KEY is not set!")
\ No newline at end of file
+@lru_cache(maxsize=None)
+def load_env():
+    # The .env file is read on the first setting looked up, not when the module is imported
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def get_giga_key():
+    load_env()
+    key = os.getenv('GIGA_KEY')
+    if not key:
+        raise ValueError("GIGA_KEY is not set!")
+    return key
+
+
+def _optional(parse):
+    # Empty or zero means "not set"
+    return lambda value: parse(value) or None
+
+
+# name -> (default, parser). Read as module attributes (from src.config import RESULTS_PATH), each one is
+# resolved from the environment on first access and then cached on the module.
+SETTINGS = {
+    # readwrite | replay | off
+    'LLM_CACHE_MODE': ('off', str),
+    'LLM_CACHE_PATH': ('llm_cache.sqlite', str),
+
+    'CHECKPOINT_PATH': ('checkpoints.sqlite', str),
+
+    # Shared API quota for all dialogues of the process (see src.pool), empty means unlimited.
+    # Each sweep worker process has its own limiter, so give every one its share of the account quota
+    'GIGA_RPS': ('0', _optional(float)),
+    'GIGA_TPM': ('0', _optional(int)),
+    'GIGA_MAX_RETRIES': ('5', int),
+
+    # Rubles per 1000 tokens for cost estimates in src.metrics, 0 disables them
+    'GIGA_PRICE_PER_1K_TOKENS': ('0', float),
+    # Port of the Prometheus endpoint started by dialogue.py, empty means no endpoint
+    'METRICS_PORT': ('0', _optional(int)),
+
+    # Root of the Parquet results store (see src.store)
+    'RESULTS_PATH': ('results', str),
+
+    # Simulations the Streamlit server runs at once, shared by all sessions (see src.runs)
+    'SIM_WORKERS': ('8', int),
+
+    # Job queue of multi-process sweeps (see src.jobqueue, sweep.py); put it on a shared disk for several hosts
+    'SWEEP_PATH': ('sweep.sqlite', str),
+}
+
+
+def __getattr__(name):
+    if name not in SETTINGS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    load_env()
+    default, parse = SETTINGS[name]
+    value = parse(os.getenv(name, default))
+    globals()[name] = value
+    return value
@@ -0,0 +1,149 @@
+import asyncio
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+WORDS = (
+    "деньги счет банк перевод вклад проценты срочно безопасность сотрудник звонок код карта "
+    "пенсия доход гарантия риск мошенники защита договор подтверждение клиент личный кабинет"
+).split()
+
+NAME = re.compile(r"Тебя зовут (.+?)\.?\s*$", re.MULTILINE)
+FOLDED = re.compile(r"^Краткое содержание первых (\d+) реплик: ")
+
+
+class FakeChatModel(BaseChatModel):
+    # Offline stand-in for GigaChat: no network, configurable latency and reply sizes, scripted or random replies.
+    # Roles are recognised by the "Тебя зовут ..." line of DEBATES_TEMPLATE; prompts without it go to the analyst.
+    latency: str = "fixed"  # fixed | uniform | lognormal
+    latency_mean: float = 0.0
+    latency_std: float = 0.0
+    token_latency: float = 0.0  # pause between streamed chunks; `latency` is the time to the first one
+    reply_words: int = 30
+    chars_per_token: float = 4.0
+    scammer_name: str = "Скам Скамыч"
+    agree_at: Optional[int] = None  # the victim answers agree_reply from this turn on (1-based)
+    agree_reply: str = "Готов!"
+    script: Dict[str, List[str]] = {}  # role name or "analyst" -> replies, cycled per turn
+    seed: Optional[int] = None
+    calls: int = 0
+
+    _rng: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gigachat"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": "fake", "agree_at": self.agree_at, "agree_reply": self.agree_reply,
+                "reply_words": self.reply_words, "seed": self.seed}
+
+    def _delay(self):
+        if self.latency == "uniform":
+            delay = self._rng.uniform(self.latency_mean - self.latency_std, self.latency_mean + self.latency_std)
+        elif self.latency == "lognormal" and self.latency_mean > 0:
+            sigma = (self.latency_std / self.latency_mean) if self.latency_std else 0.0
+            delay = self.latency_mean * self._rng.lognormvariate(-sigma ** 2 / 2, sigma)
+        else:
+            delay = self.latency_mean
+        return max(0.0, delay)
+
+    def _reply(self, messages: List[BaseMessage]):
+        system = next((m.content for m in messages if isinstance(m, SystemMessage)), None)
+        found = NAME.search(system) if system else None
+        role = found.group(1).strip() if found else "analyst"
+        history = messages[-1].content
+        if "Новые реплики:" in history:
+            return " ".join(self._rng.choice(WORDS) for _ in range(self.reply_words)).capitalize() + "."
+        folded = 0
+        if found_folded := FOLDED.match(history):
+            folded = int(found_folded.group(1))
+            history = history.split("\n\n", 1)[-1]
+        lines = [line for line in history.splitlines() if line.strip()] if ": " in history else []
+        turn = (folded + len(lines)) // 2 + 1
+
+        if role in self.script:
+            replies = self.script[role]
+            return replies[(turn - 1) % len(replies)]
+        if role == "analyst":
+            last = lines[-1].lower() if lines else ""
+            return "scammed" if "готов" in last and "не готов" not in last else "not scammed"
+        if role != self.scammer_name and self.agree_at is not None and turn >= self.agree_at:
+            return self.agree_reply
+        n = max(1, int(self._rng.gauss(self.reply_words, self.reply_words / 4)))
+        return " ".join(self._rng.choice(WORDS) for _ in range(n)).capitalize() + "."
+
+    def _result(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                max_tokens: Optional[int] = None):
+        # stop and max_tokens end the reply the way GigaChat does, see src.budget
+        self.calls += 1
+        text = self._reply(messages)
+        finish_reason = "stop"
+        for marker in stop or ():
+            if (found := text.find(marker)) > 0:
+                text = text[:found]
+        if max_tokens and len(text) > max_tokens * self.chars_per_token:
+            text = text[:int(max_tokens * self.chars_per_token)]
+            finish_reason = "length"
+        prompt_tokens = int(sum(len(str(m.content)) for m in messages) / self.chars_per_token)
+        completion_tokens = int(len(text) / self.chars_per_token) + 1
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"finish_reason": finish_reason},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay())
+        return self._result(messages, stop, kwargs.get("max_tokens"))
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return self._result(messages, stop, kwargs.get("max_tokens"))
+
+    def _chunks(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                max_tokens: Optional[int] = None):
+        message = self._result(messages, stop, max_tokens).generations[0].message
+        words = message.content.split(" ")
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            chunk = AIMessageChunk(content=word if last else word + " ",
+                                   usage_metadata=message.usage_metadata if last else None)
+            yield ChatGenerationChunk(message=chunk)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any):
+        time.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(messages, stop, kwargs.get("max_tokens"))):
+            if i:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any):
+        await asyncio.sleep(self._delay())
+        for i, chunk in enumerate(self._chunks(messages, stop, kwargs.get("max_tokens"))):
+            if i:
+                await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
@@ -0,0 +1,208 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from pydantic import BaseModel
+
+# Durable work queue for sweeps that outgrow one process. Jobs live in one SQLite file (WAL mode) that
+# every worker process on the machine opens. Single host only: WAL needs shared memory, so on NFS or SMB
+# readers can miss commits and two hosts can lease the same job. The SQLite checkpoint file has the same limit.
+# A worker leases a job for lease_seconds and renews the lease while the dialogue runs. If the worker dies,
+# the lease expires and another worker takes the job over: with a shared checkpoint file it continues from
+# the last checkpoint (see batch.run_job). A job is tried max_attempts times before it is marked failed.
+# Results are written once: complete() only succeeds for the current lease holder of a job not yet done,
+# so a worker whose lease was taken over cannot overwrite or duplicate the result.
+
+# Jobs are spread over SHARDS shards by a hash of their id, so workers can split a sweep without contention
+SHARDS = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    sweep TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    shard INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending | leased | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (sweep, job_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (sweep, status, shard);
+CREATE TABLE IF NOT EXISTS sweeps (
+    sweep TEXT PRIMARY KEY,
+    settings TEXT NOT NULL,  -- run settings every worker of the sweep uses
+    created REAL NOT NULL
+);
+"""
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shard_of(job_id: str, shards: int):
+    # Stable across processes, unlike hash()
+    return zlib.crc32(job_id.encode("utf-8")) % shards
+
+
+def _shard_filter(shards: Optional[List[int]]):
+    return f" AND shard IN ({','.join('?' * len(shards))})" if shards else ""
+
+
+class JobQueue:
+    def __init__(self, path: str, lease_seconds: float = 900, max_attempts: int = 3, shards: int = SHARDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.shards = shards
+        conn = sqlite3.connect(self.path, timeout=60)
+        try:
+            # WAL is a property of the file: readers (status) never block the workers
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation: safe from any thread or event loop, and nothing is held
+        # between the few writes a job makes. BEGIN IMMEDIATE takes the write lock up front, so two workers
+        # can never lease the same row.
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def enqueue(self, jobs: Iterable[BaseModel], sweep: str = "default", settings: Optional[dict] = None) -> int:
+        # Jobs already in the sweep are left alone, so enqueueing the same grid twice is harmless.
+        # settings are fixed by the first enqueue: extending a sweep with other settings is an error
+        now = time.time()
+        rows = [(sweep, job.thread_id, shard_of(job.thread_id, self.shards), job.model_dump_json(), now, now)
+                for job in jobs]
+        with self._connect() as conn:
+            encoded = json.dumps(settings or {}, sort_keys=True)
+            row = conn.execute("SELECT settings FROM sweeps WHERE sweep = ?", (sweep,)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sweeps (sweep, settings, created) VALUES (?, ?, ?)", (sweep, encoded, now))
+            elif settings is not None and row[0] != encoded:
+                raise ValueError(f"Sweep {sweep!r} was started with settings {row[0]}, not {encoded}")
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO jobs (sweep, job_id, shard, payload, created, updated) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", rows)
+            return conn.total_changes - before
+
+    def settings(self, sweep: str = "default") -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT settings FROM sweeps WHERE sweep = ?", (sweep,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def lease(self, worker: str, sweep: str = "default", limit: int = 1, shards: Optional[List[int]] = None):
+        # Returns [(job_id, payload dict)]. shards restricts the worker to part of the sweep, e.g. one
+        # process per shard range; without it every worker competes for every job.
+        now = time.time()
+        shard_filter = _shard_filter(shards)
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', error = 'lease expired after the last attempt', "
+                         "lease_owner = NULL, updated = ? "
+                         "WHERE sweep = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                         (now, sweep, now, self.max_attempts))
+            rows = conn.execute(
+                "SELECT job_id, payload FROM jobs WHERE sweep = ? "
+                "AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))" + shard_filter +
+                # Expired leases first: their dialogues are part done in the checkpoints
+                " ORDER BY status = 'pending', shard, job_id LIMIT ?",
+                (sweep, now, *(shards or ()), limit),
+            ).fetchall()
+            conn.executemany("UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, "
+                             "attempts = attempts + 1, updated = ? WHERE sweep = ? AND job_id = ?",
+                             [(worker, now + self.lease_seconds, now, sweep, job_id) for job_id, _ in rows])
+        return [(job_id, json.loads(payload)) for job_id, payload in rows]
+
+    def renew(self, worker: str, job_ids: List[str], sweep: str = "default") -> List[str]:
+        # Extends the leases still held by this worker and returns the ids it has lost
+        now = time.time()
+        lost = []
+        with self._connect() as conn:
+            for job_id in job_ids:
+                updated = conn.execute("UPDATE jobs SET lease_expires = ?, updated = ? "
+                                       "WHERE sweep = ? AND job_id = ? AND status = 'leased' AND lease_owner = ?",
+                                       (now + self.lease_seconds, now, sweep, job_id, worker)).rowcount
+                if not updated:
+                    lost.append(job_id)
+        return lost
+
+    def complete(self, worker: str, job_id: str, result: dict, sweep: str = "default") -> bool:
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET status = 'done', result = ?, error = NULL, lease_owner = NULL, "
+                                "updated = ? WHERE sweep = ? AND job_id = ? AND status = 'leased' "
+                                "AND lease_owner = ?",
+                                (json.dumps(result, ensure_ascii=False), time.time(), sweep, job_id,
+                                 worker)).rowcount == 1
+
+    def fail(self, worker: str, job_id: str, error: str, sweep: str = "default") -> Optional[str]:
+        # Back to pending while attempts remain, otherwise failed; None if the lease was already lost
+        with self._connect() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE sweep = ? AND job_id = ? AND status = 'leased' "
+                               "AND lease_owner = ?", (sweep, job_id, worker)).fetchone()
+            if row is None:
+                return None
+            status = "failed" if row[0] >= self.max_attempts else "pending"
+            conn.execute("UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                         "updated = ? WHERE sweep = ? AND job_id = ?",
+                         (status, error, time.time(), sweep, job_id))
+            return status
+
+    def retry_failed(self, sweep: str = "default") -> int:
+        with self._connect() as conn:
+            return conn.execute("UPDATE jobs SET status = 'pending', attempts = 0, updated = ? "
+                                "WHERE sweep = ? AND status = 'failed'", (time.time(), sweep)).rowcount
+
+    def progress(self, sweep: str = "default", window: float = 300, shards: Optional[List[int]] = None) -> dict:
+        # Counts by status plus the completion rate over the last `window` seconds and the time left at that rate
+        now = time.time()
+        shard_filter = _shard_filter(shards)
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs WHERE sweep = ?" + shard_filter +
+                                       " GROUP BY status", (sweep, *(shards or ()))).fetchall())
+            recent, first_done = conn.execute("SELECT SUM(updated >= ?), MIN(updated) FROM jobs WHERE sweep = ? "
+                                              "AND status = 'done'" + shard_filter,
+                                              (now - window, sweep, *(shards or ()))).fetchone()
+            workers = conn.execute("SELECT COUNT(DISTINCT lease_owner) FROM jobs WHERE sweep = ? "
+                                   "AND status = 'leased' AND lease_expires >= ?", (sweep, now)).fetchone()[0]
+        progress = {status: counts.get(status, 0) for status in ("pending", "leased", "done", "failed")}
+        progress["total"] = sum(progress.values())
+        progress["workers"] = workers
+        # A sweep whose first job finished less than `window` ago is measured over the time since then
+        span = min(window, now - first_done) if first_done is not None else window
+        progress["per_minute"] = (recent or 0) * 60 / span if span > 0 else 0.0
+        remaining = progress["pending"] + progress["leased"]
+        rate = progress["per_minute"]
+        progress["eta_seconds"] = remaining * 60 / rate if remaining and rate else None
+        return progress
+
+    def unfinished(self, sweep: str = "default", shards: Optional[List[int]] = None) -> bool:
+        progress = self.progress(sweep, shards=shards)
+        return bool(progress["pending"] or progress["leased"])
+
+    def results(self, sweep: str = "default"):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT result FROM jobs WHERE sweep = ? AND status = 'done' ORDER BY job_id",
+                                (sweep,)).fetchall()
+        return [json.loads(result) for result, in rows]
@@ -0,0 +1,77 @@
+from collections import defaultdict
+from functools import lru_cache
+from typing import Optional
+
+from langchain_core.messages import AIMessage
+from prometheus_client import CollectorRegistry, Counter, Histogram, start_http_server
+
+from . import config
+from .utils import NodeMetric
+
+# Process-wide, so Streamlit sessions, batch runs and the estimator all report into the same series.
+# A dedicated registry keeps the endpoint free of the default process/GC collectors.
+REGISTRY = CollectorRegistry()
+
+NODE_SECONDS = Histogram("fraudsim_node_seconds", "Wall time of one node call", ["node"], registry=REGISTRY,
+                         buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 20, 60, 120))
+NODE_CALLS = Counter("fraudsim_node_calls", "Node calls by how they were answered", ["node", "source"],
+                     registry=REGISTRY)
+NODE_TOKENS = Counter("fraudsim_node_tokens", "Tokens billed to a node", ["node", "kind"], registry=REGISTRY)
+NODE_RETRIES = Counter("fraudsim_node_retries", "API retries made on behalf of a node", ["node"],
+                       registry=REGISTRY)
+NODE_COST = Counter("fraudsim_node_cost_rub", "Estimated API cost of a node, rubles", ["node"], registry=REGISTRY)
+
+
+def record_call(node: str, seconds: float, message: Optional[AIMessage] = None, source: Optional[str] = None):
+    # usage_metadata and response_metadata are set by the chat model, the pool (retries)
+    # and the response cache (cache_hit), see src.pool and src.cache
+    usage = (message.usage_metadata if message is not None else None) or {}
+    meta = message.response_metadata if message is not None else {}
+    source = source or ("cache" if meta.get("cache_hit") else "llm")
+    prompt_tokens = usage.get("input_tokens", 0) if source == "llm" else 0
+    completion_tokens = usage.get("output_tokens", 0) if source == "llm" else 0
+    retries = meta.get("retries", 0) if source == "llm" else 0
+    cost = (prompt_tokens + completion_tokens) / 1000 * config.GIGA_PRICE_PER_1K_TOKENS
+
+    NODE_SECONDS.labels(node).observe(seconds)
+    NODE_CALLS.labels(node, source).inc()
+    NODE_TOKENS.labels(node, "prompt").inc(prompt_tokens)
+    NODE_TOKENS.labels(node, "completion").inc(completion_tokens)
+    NODE_RETRIES.labels(node).inc(retries)
+    NODE_COST.labels(node).inc(cost)
+
+    return NodeMetric(node=node, source=source, seconds=seconds, prompt_tokens=prompt_tokens,
+                      completion_tokens=completion_tokens, retries=retries, cost=cost)
+
+
+@lru_cache(maxsize=None)
+def start_metrics_server(port: int):
+    # Cached so Streamlit reruns do not try to bind the port again
+    start_http_server(port, registry=REGISTRY)
+    return port
+
+
+def summary():
+    # Per-node totals read back from the registry, for the dashboard
+    rows = defaultdict(lambda: {"calls": 0, "llm": 0, "cache": 0, "rules": 0, "seconds": 0.0,
+                                "prompt_tokens": 0, "completion_tokens": 0, "retries": 0, "cost": 0.0})
+    for metric in REGISTRY.collect():
+        for sample in metric.samples:
+            node = sample.labels.get("node")
+            if node is None:
+                continue
+            row = rows[node]
+            if sample.name == "fraudsim_node_calls_total":
+                row[sample.labels["source"]] += int(sample.value)
+                row["calls"] += int(sample.value)
+            elif sample.name == "fraudsim_node_seconds_sum":
+                row["seconds"] += sample.value
+            elif sample.name == "fraudsim_node_tokens_total":
+                row[f"{sample.labels['kind']}_tokens"] += int(sample.value)
+            elif sample.name == "fraudsim_node_retries_total":
+                row["retries"] += int(sample.value)
+            elif sample.name == "fraudsim_node_cost_rub_total":
+                row["cost"] += sample.value
+    for row in rows.values():
+        row["mean_seconds"] = row["seconds"] / row["calls"] if row["calls"] else 0.0
+    return dict(rows)
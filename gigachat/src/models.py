@@ -0,0 +1,137 @@
+import re
+from typing import Dict, List, Optional, TypedDict
+
+from pydantic import BaseModel, PrivateAttr
+
+# Plain data definitions: roles, cases, transcripts and run configs. Nothing here imports LangChain or
+# LangGraph, so src.roles_and_cases, the results store and tooling load without the LLM stack.
+
+
+class Role(TypedDict):
+    name: str
+    bio: str
+    template: str
+
+
+class SuccessRules(BaseModel):
+    # Literal phrases from success_condition that settle a victim message without the LLM analyst.
+    # scammed: a match in a sentence without any negation or hedge means the victim agreed; a hedged one
+    # ("не уверена, что готова перевести") is left to the analyst.
+    # cues: if none of them occurs, the message cannot satisfy the condition, so keep them broad.
+    # Anything in between is ambiguous and goes to the analyst.
+    scammed: List[str]
+    cues: List[str]
+
+    _scammed: re.Pattern = PrivateAttr()
+    _cues: re.Pattern = PrivateAttr()
+
+    def model_post_init(self, __context):
+        self._scammed = re.compile("|".join(f"(?:{p})" for p in self.scammed), re.IGNORECASE)
+        self._cues = re.compile("|".join(f"(?:{p})" for p in self.cues), re.IGNORECASE)
+
+    def match(self, text: str) -> Optional[bool]:
+        hedged = False
+        for sentence in SENTENCE.findall(text):
+            if self._scammed.search(sentence):
+                if not HEDGE.search(sentence):
+                    return True
+                hedged = True
+        if hedged or self._cues.search(text):
+            return None
+        return False
+
+
+SENTENCE = re.compile(r"[^.!?…\n]+[.!?…]*")
+# Negations, doubts, conditions, questions and reported speech ("просят, чтобы я перевела") anywhere in a
+# sentence make its agreement uncertain
+HEDGE = re.compile(
+    r"\b(?:не|ни|нет|никак\w*|никогда|уверен\w*|может\w*|наверн\w*|подума\w*|сомнева\w*|если|или|пока|"
+    r"позже|потом|вряд|боюсь|страшно|когда|чтоб\w*|прос(?:ят|ит|ил\w*)|сказал\w*|говор\w*)\b|\?",
+    re.IGNORECASE,
+)
+
+
+class FraudCase(BaseModel):
+    name: str
+    description: str
+    success_condition: str
+    profiles: Dict[str, Role]
+    success_rules: Optional[SuccessRules] = None
+
+
+class Turn(TypedDict):
+    role: str  # "scammer" | "victim"
+    text: str
+    line: str  # "Name: text", rendered once when the turn is produced
+
+
+def make_turn(role: str, name: str, text: str) -> Turn:
+    return Turn(role=role, text=text, line=f"{name}: {text}")
+
+
+def add_turns(left: List[Turn], right: List[Turn]) -> List[Turn]:
+    # Append-only: existing turns are never re-rendered, only the new ones are added.
+    # A new list (not extend) keeps earlier checkpoints and stream snapshots unchanged. It copies references
+    # to the existing turns, one pointer per turn and no string work; the checkpointer serializes the whole
+    # channel on every step anyway, so an in-place append would not make a checkpointed dialogue cheaper.
+    return left + right
+
+
+def render_transcript(turns: List[Turn], role: Optional[str] = None, start: int = 0,
+                      end: Optional[int] = None) -> str:
+    return "\n".join(t["line"] for t in turns[start:end] if role is None or t["role"] == role)
+
+
+class MemoryConfig(BaseModel):
+    # Prompts keep the last `window` turns verbatim; older turns are folded into a running summary
+    # once `every` new turns have piled up beyond the window.
+    window: int = 6
+    every: int = 4
+
+
+class StallConfig(BaseModel):
+    # A round (scammer turn + victim reply) repeats when both turns share at least `similarity` of their
+    # word `ngram` shingles (Jaccard) with one of the same side's last `window` turns.
+    # The dialogue is stalled after `patience` repeating rounds in a row or `refusals` refusing replies in a row.
+    ngram: int = 3
+    window: int = 4
+    similarity: float = 0.5
+    patience: int = 2
+    refusals: int = 4
+
+
+class ScheduleConfig(BaseModel):
+    # Which victim turns the LLM analyst judges when the success rules cannot (see src.scheduling).
+    # policy: always | every | cues | escalate, or any name added with scheduling.register_policy.
+    # every: at most this many victim turns between verdicts (every, escalate).
+    # cues: regexes for the cues policy, by default scheduling.MONEY_CUES; they should be narrower than the
+    # case's SuccessRules cues, which every scheduled turn already matches.
+    policy: str = "always"
+    every: int = 3
+    cues: Optional[List[str]] = None
+
+
+class BudgetConfig(BaseModel):
+    # Output limits in tokens per role. Speakers are also stopped at the other side's "Name:" line, and
+    # whatever extra turns still get through are cut off (see src.budget)
+    scammer: int = 200
+    victim: int = 200
+    analyst: int = 8
+    summarize: int = 300
+
+
+class NodeMetric(TypedDict):
+    node: str  # scammer | victim | analyst | summarize
+    source: str  # llm | cache | rules
+    seconds: float
+    prompt_tokens: int
+    completion_tokens: int
+    retries: int
+    cost: float
+
+
+class Verdict(TypedDict):
+    turn: int  # message_count the analyst judged
+    analysis: str
+    is_scammed: bool
+    source: str  # llm | rules
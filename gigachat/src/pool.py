@@ -0,0 +1,273 @@
+import asyncio
+import random
+import threading
+import time
+from itertools import chain
+from typing import Any, List, Optional
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from pydantic import PrivateAttr
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    # Token bucket over requests/sec and tokens/min shared by every thread and event loop of the process.
+    # A caller reserves capacity up front and gets back how long to wait for it, so queued callers are spaced
+    # out instead of polling; token usage is corrected once the real count is known.
+
+    def __init__(self, rps: Optional[float] = None, tpm: Optional[int] = None, burst: Optional[float] = None):
+        self.rps = rps
+        self.tpm = tpm
+        self.burst = burst or (max(1.0, rps) if rps else 1.0)
+        self._lock = threading.Lock()
+        self._requests = self.burst
+        self._tokens = float(tpm or 0)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rps:
+            self._requests = min(self.burst, self._requests + elapsed * self.rps)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def reserve(self, tokens: int = 0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = max(0.0, self._paused_until - now)
+            if self.rps:
+                self._requests -= 1
+                delay = max(delay, -self._requests / self.rps)
+            if self.tpm:
+                self._tokens -= min(tokens, self.tpm)
+                delay = max(delay, -self._tokens * 60 / self.tpm)
+            return delay
+
+    def settle(self, tokens: int):
+        # Positive when the call used more tokens than reserved
+        if self.tpm and tokens:
+            with self._lock:
+                self._refill(time.monotonic())
+                self._tokens -= tokens
+
+    def pause(self, seconds: float):
+        # After a 429 nobody should hit the API until the server-side window has passed
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _response_status(error: Exception) -> Optional[int]:
+    # gigachat raises ResponseError(url, status_code, content, headers). Matched by class name, so the retry
+    # path neither imports gigachat on every error nor needs it at all, e.g. with FakeChatModel
+    if len(error.args) > 1 and any(cls.__name__ == "ResponseError" for cls in type(error).__mro__):
+        return error.args[1]
+    return None
+
+
+def _retry_delay(error: Exception, attempt: int, base: float, cap: float) -> Optional[float]:
+    status = _response_status(error)
+    if status is not None:
+        if status not in RETRY_STATUSES:
+            return None
+        headers = error.args[3] if len(error.args) > 3 and error.args[3] else {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+    elif not isinstance(error, httpx.TransportError):
+        return None
+    # Full jitter keeps the clients that failed together from retrying together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _usage(result: ChatResult) -> int:
+    total = 0
+    for generation in result.generations:
+        usage = getattr(generation.message, "usage_metadata", None)
+        if usage:
+            total += usage.get("total_tokens", 0)
+    return total
+
+
+def _mark_retries(message: BaseMessage, attempt: int):
+    # Lets the node that made the call report its retries (see src.metrics)
+    if attempt:
+        message.response_metadata = {**message.response_metadata, "retries": attempt}
+
+
+class PooledChatModel(BaseChatModel):
+    # Wraps one chat model (and so one HTTP connection pool and one cached OAuth token) for the whole process
+    # and puts the shared RateLimiter and retries in front of it. Cache keys are those of the wrapped model.
+    model: BaseChatModel
+    limiter: RateLimiter
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_cap: float = 30.0
+    chars_per_token: float = 3.0
+
+    _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: dict = PrivateAttr(default_factory=dict)
+    _started: Optional[float] = PrivateAttr(default=None)
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def model_post_init(self, __context):
+        self.reset_stats()
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self):
+        return self.model._identifying_params
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._started = None
+            self._stats = {"requests": 0, "retries": 0, "failures": 0, "tokens": 0,
+                           "in_flight": 0, "peak_in_flight": 0, "throttled_seconds": 0.0}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            elapsed = time.monotonic() - self._started if self._started else 0.0
+        stats["rps"] = stats["requests"] / elapsed if elapsed else 0.0
+        stats["tpm"] = stats["tokens"] * 60 / elapsed if elapsed else 0.0
+        stats["rps_utilization"] = stats["rps"] / self.limiter.rps if self.limiter.rps else None
+        stats["tpm_utilization"] = stats["tpm"] / self.limiter.tpm if self.limiter.tpm else None
+        return stats
+
+    def _count(self, **deltas):
+        with self._stats_lock:
+            if self._started is None:
+                self._started = time.monotonic()
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+            self._stats["peak_in_flight"] = max(self._stats["peak_in_flight"], self._stats["in_flight"])
+
+    def _estimate(self, messages: List[BaseMessage]) -> int:
+        return int(sum(len(str(m.content)) for m in messages) / self.chars_per_token)
+
+    def _reserve(self, messages: List[BaseMessage]):
+        estimate = self._estimate(messages)
+        delay = self.limiter.reserve(estimate)
+        self._count(throttled_seconds=delay)
+        return estimate, delay
+
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        self._count(in_flight=-1)
+        delay = _retry_delay(error, attempt, self.backoff_base, self.backoff_cap)
+        if delay is None or attempt >= self.max_retries:
+            self._count(failures=1)
+            raise error
+        if _response_status(error) == 429:
+            self.limiter.pause(delay)
+        self._count(retries=1)
+        return delay
+
+    def _on_result(self, estimate: int, used: int):
+        self.limiter.settle(used - estimate if used else 0)
+        self._count(requests=1, tokens=used or estimate, in_flight=-1)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            estimate, delay = self._reserve(messages)
+            time.sleep(delay)
+            self._count(in_flight=1)
+            try:
+                result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self._on_result(estimate, _usage(result))
+            _mark_retries(result.generations[0].message, attempt)
+            return result
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        for attempt in range(self.max_retries + 1):
+            estimate, delay = self._reserve(messages)
+            await asyncio.sleep(delay)
+            self._count(in_flight=1)
+            try:
+                result = await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+                continue
+            self._on_result(estimate, _usage(result))
+            _mark_retries(result.generations[0].message, attempt)
+            return result
+
+    # A stream is only retried until its first chunk: after that the caller has already seen partial output
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs: Any):
+        for attempt in range(self.max_retries + 1):
+            estimate, delay = self._reserve(messages)
+            time.sleep(delay)
+            self._count(in_flight=1)
+            chunks = self.model._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = next(chunks)
+            except StopIteration:
+                self._on_result(estimate, 0)
+                return
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            _mark_retries(first.message, attempt)
+            used = 0
+            try:
+                for chunk in chain([first], chunks):
+                    if chunk.message.usage_metadata:
+                        used = chunk.message.usage_metadata.get("total_tokens", used)
+                    yield chunk
+            except Exception:
+                self._count(failures=1, in_flight=-1)
+                raise
+            self._on_result(estimate, used)
+            return
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any):
+        for attempt in range(self.max_retries + 1):
+            estimate, delay = self._reserve(messages)
+            await asyncio.sleep(delay)
+            self._count(in_flight=1)
+            chunks = self.model._astream(messages, stop=stop, run_manager=run_manager, **kwargs)
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                self._on_result(estimate, 0)
+                return
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+                continue
+            _mark_retries(first.message, attempt)
+            used = 0
+            try:
+                chunk = first
+                while True:
+                    if chunk.message.usage_metadata:
+                        used = chunk.message.usage_metadata.get("total_tokens", used)
+                    yield chunk
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        break
+            except Exception:
+                self._count(failures=1, in_flight=-1)
+                raise
+            self._on_result(estimate, used)
+            return
@@ -0,0 +1,67 @@
+import re
+from typing import Dict, Optional
+
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate
+
+from .models import FraudCase, Role
+from .utils import DEBATES_TEMPLATE, SUMMARY_TEMPLATE, VERDICT_INSTRUCTION
+
+# Prompts are rendered once per (case, role) when a graph is compiled. Everything that is fixed for the
+# dialogue goes into a ready SystemMessage, and the per-call part is a single trailing "{history}" message.
+# The prefix is then byte-identical on every call: provider-side prefix caching and our response cache
+# (src.cache) can hit, and no call re-formats the long system prompt.
+
+PLACEHOLDER = re.compile(r"\{\{|\}\}|\{(\w*)\}")
+
+
+def render(template: str, fields: Dict[str, str], where: str):
+    # str.format over known fields only: unknown placeholders are an error, not text sent to the model.
+    # A literal brace in a template is written as {{ or }}
+    def replace(match):
+        if match.group(0) in ("{{", "}}"):
+            return match.group(0)[0]
+        name = match.group(1)
+        if name not in fields:
+            raise ValueError(f"Unknown placeholder {{{name}}} in {where}, expected one of {sorted(fields)}")
+        return fields[name]
+
+    return PLACEHOLDER.sub(replace, template)
+
+
+def _static_fields(case: FraudCase, person: Role, opponent: Optional[Role] = None):
+    return {
+        "bio": person["bio"],
+        "name": person["name"],
+        "bio2": opponent["bio"] if opponent else "",
+        "name2": opponent["name"] if opponent else "",
+        "fraud_scheme": case.description,
+        "fraud_success": case.success_condition,
+        "success_conditions": case.success_condition,
+    }
+
+
+def _history_prompt(system: str, user: str = "{history}"):
+    return ChatPromptTemplate.from_messages([SystemMessage(content=system), ("user", user)])
+
+
+def person_prompt(case: FraudCase, person: Role, opponent: Role):
+    fields = _static_fields(case, person, opponent)
+    where = f"the template of {person['name']} ({case.name})"
+    template = render(person["template"], fields, where)
+    return _history_prompt(render(DEBATES_TEMPLATE, {**fields, "template": template}, "DEBATES_TEMPLATE"))
+
+
+def analyst_system(case: FraudCase, analyst: Role):
+    return render(analyst["template"], _static_fields(case, analyst), f"the analyst template ({case.name})")
+
+
+def analyst_prompt(case: FraudCase, analyst: Optional[Role] = None):
+    system = analyst_system(case, analyst or case.profiles["analyst"]) + VERDICT_INSTRUCTION
+    return _history_prompt(system, "Переписка:\n{history}")
+
+
+def summary_prompt(scammer: Role, victim: Role):
+    # The running summary changes every fold, so it travels with the new turns in the per-call message
+    system = render(SUMMARY_TEMPLATE, {"name": scammer["name"], "name2": victim["name"]}, "SUMMARY_TEMPLATE")
+    return _history_prompt(system, "Текущий конспект:\n{summary}\n\nНовые реплики:\n{history}")
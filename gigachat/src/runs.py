@@ -0,0 +1,123 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Simulations started from the UI run here, on a worker pool shared by every session of the server process,
+# instead of inside the Streamlit script thread. A Run collects the dialogue as it streams in; pages poll
+# Run.snapshot() and can come back to a run by its id (the thread id) after a reload.
+
+ACTIVE = ("queued", "running")
+
+
+class Run:
+    def __init__(self, run_id: str, meta: dict, dialogue=(), verdicts=()):
+        self.run_id = run_id
+        self.meta = meta  # whatever the page needs to reattach, e.g. case, victim and run settings
+        self.status = "queued"  # queued | running | done | failed
+        self.dialogue = list(dialogue)  # (role, text, message_count)
+        self.verdicts = list(verdicts)  # (analysis, is_scammed, message_count)
+        self.live = None  # (role, text so far) of the message being generated
+        self.outcome = None
+        self.error = None
+        self.traceback = None
+        self.submitted = time.time()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "run_id": self.run_id,
+                "meta": self.meta,
+                "status": self.status,
+                "dialogue": list(self.dialogue),
+                "verdicts": list(self.verdicts),
+                "live": self.live,
+                "outcome": self.outcome,
+                "error": self.error,
+                "traceback": self.traceback,
+            }
+
+    def _set(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                setattr(self, key, value)
+
+    def _stream_chunk(self, role: str, text: str):
+        with self._lock:
+            previous = self.live[1] if self.live and self.live[0] == role else ""
+            self.live = (role, previous + text)
+
+    def _apply(self, update: dict, speakers: Dict[str, str]):
+        # One "updates" item of graph.stream: new turns of the speaker nodes and the analyst's verdict
+        with self._lock:
+            for node, role in speakers.items():
+                if node in update:
+                    self.live = None
+                    self.dialogue.append((role, update[node]["transcript"][0]["line"], update[node]["message_count"]))
+            analyst = update.get("analyst")
+            if analyst is None:
+                return
+            # Turns the analyst schedule skipped carry no verdict
+            if "analysis" in analyst:
+                count = self.dialogue[-1][2] if self.dialogue else 0
+                self.verdicts.append((analyst["analysis"], analyst.get("is_scammed", False), count))
+            self.outcome = analyst.get("outcome")
+
+
+class RunManager:
+    # One per server process (see dialogue.run_manager). At most `workers` dialogues run at once,
+    # the rest wait in the pool's queue; the last `keep` runs stay available for reattaching.
+
+    def __init__(self, workers: int = 8, keep: int = 256):
+        self.workers = workers
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="simulation")
+        self._lock = threading.Lock()
+        self._runs: "OrderedDict[str, Run]" = OrderedDict()
+
+    def get(self, run_id: str) -> Optional[Run]:
+        with self._lock:
+            return self._runs.get(run_id)
+
+    def submit(self, run: Run, graph, inputs: Optional[dict], config: dict, speakers: Dict[str, str],
+               on_done: Optional[Callable[[Run], None]] = None) -> Run:
+        # speakers: graph node name -> "scammer" | "victim"; on_done runs in the worker after a successful run
+        with self._lock:
+            current = self._runs.get(run.run_id)
+            if current is not None and current.status in ACTIVE:
+                raise ValueError(f"Run {run.run_id!r} is already {current.status}")
+            self._runs[run.run_id] = run
+            self._runs.move_to_end(run.run_id)
+            finished = [key for key, r in self._runs.items() if r.status not in ACTIVE]
+            for key in finished[:max(0, len(self._runs) - self.keep)]:
+                del self._runs[key]
+        self._pool.submit(self._execute, run, graph, inputs, config, speakers, on_done)
+        return run
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [run.status for run in self._runs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def _execute(self, run: Run, graph, inputs, config, speakers, on_done):
+        run._set(status="running")
+        try:
+            for kind, payload in graph.stream(inputs, config, stream_mode=["messages", "updates"]):
+                if kind == "messages":
+                    chunk, metadata = payload
+                    role = speakers.get(metadata.get("langgraph_node"))
+                    if role is not None:
+                        run._stream_chunk(role, chunk.content)
+                else:
+                    run._apply(payload, speakers)
+            if on_done is not None:
+                on_done(run)
+        except Exception as e:
+            run._set(status="failed", live=None, error=f"{type(e).__name__}: {e}",
+                     traceback=traceback.format_exc(), finished=time.time())
+            return
+        run._set(status="done", live=None, finished=time.time())
@@ -0,0 +1,81 @@
+import math
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from .stall import stall_update
+from .utils import DialogState, FraudCase, ScheduleConfig, StallConfig
+
+# Decides whether the LLM analyst judges the victim turn that was just written. A skipped turn gets no
+# verdict; the next scheduled one sees the whole transcript anyway. The round that ends the dialogue
+# (max_count reached or a stall) is always judged, so the final verdict never rests on a skipped turn.
+
+MONEY_CUES = (
+    r"деньг", r"денег", r"руб", r"₽", r"перев[её]д", r"перевод", r"перевест", r"перевел", r"сч[её]т", r"карт",
+    r"код", r"\d{4,}", r"влож", r"плат", r"оплат", r"готов", r"соглас", r"отправ", r"сниму", r"налич",
+)
+
+Policy = Callable[[DialogState, ScheduleConfig, FraudCase], bool]
+POLICIES: Dict[str, Policy] = {}
+
+
+def register_policy(name: str):
+    def register(policy: Policy):
+        POLICIES[name] = policy
+        return policy
+    return register
+
+
+def _since_verdict(state: DialogState):
+    # Victim turns written since the last verdict (rules or LLM), the current one included
+    verdicts = state.get("verdicts") or []
+    last = verdicts[-1]["turn"] if verdicts else 0
+    return (state.get("message_count", 0) - last) // 2
+
+
+@lru_cache(maxsize=64)
+def _cue_pattern(patterns: Tuple[str, ...]):
+    return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+
+
+@register_policy("always")
+def always(state: DialogState, config: ScheduleConfig, case: FraudCase):
+    return True
+
+
+@register_policy("every")
+def every(state: DialogState, config: ScheduleConfig, case: FraudCase):
+    return _since_verdict(state) >= config.every
+
+
+@register_policy("cues")
+def cues(state: DialogState, config: ScheduleConfig, case: FraudCase):
+    # Defaults to MONEY_CUES rather than the case's SuccessRules cues: a turn only reaches the schedule because
+    # one of those matched, so they would fire on every turn like "always"
+    patterns = config.cues or MONEY_CUES
+    return _cue_pattern(tuple(patterns)).search(state["transcript"][-1]["text"]) is not None
+
+
+@register_policy("escalate")
+def escalate(state: DialogState, config: ScheduleConfig, case: FraudCase):
+    # The allowed gap shrinks from `every` at the start to every turn at max_count,
+    # where agreement is most likely and a late miss costs the most
+    max_count = state.get("max_count", 20)
+    remaining = max(0, max_count - state.get("message_count", 0))
+    return _since_verdict(state) >= max(1, math.ceil(config.every * remaining / max_count))
+
+
+def is_final(state: DialogState, stall: Optional[StallConfig] = None):
+    # True when nothing but a "scammed" verdict can keep the dialogue from ending after this round
+    if state.get("message_count", 0) >= state.get("max_count", 20):
+        return True
+    return stall is not None and stall_update(state.get("stall"), state["transcript"][-2:], False, stall)["stalled"]
+
+
+def analyst_due(state: DialogState, case: FraudCase, schedule: Optional[ScheduleConfig] = None,
+                stall: Optional[StallConfig] = None):
+    if schedule is None or schedule.policy == "always":
+        return True
+    if schedule.policy not in POLICIES:
+        raise ValueError(f"Unknown analyst schedule {schedule.policy!r}, expected one of {sorted(POLICIES)}")
+    return POLICIES[schedule.policy](state, schedule, case) or is_final(state, stall)
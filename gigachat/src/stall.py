@@ -0,0 +1,51 @@
+import re
+import zlib
+from typing import List, Optional
+
+from .models import StallConfig, Turn
+
+WORD = re.compile(r"\w+")
+REFUSAL = re.compile(
+    r"\b(?:нет|отказыва\w*|ни\s+в\s+коем\s+случае|(?:вы|это|ты)\s+мошенни\w*|до\s+свидания|положу\s+трубку|"
+    r"не\s+звоните|не\s+(?:буду|хочу|верю|интересно|надо|нужно|стану|собираюсь|дам|скажу|переведу|готова?))\b"
+)
+
+
+def shingles(text: str, n: int):
+    # Hashed word n-grams, so the state keeps small ints instead of strings
+    words = WORD.findall(text.lower())
+    grams = [" ".join(words[i:i + n]) for i in range(max(1, len(words) - n + 1))]
+    return sorted({zlib.crc32(g.encode("utf-8")) for g in grams if g})
+
+
+def jaccard(a: List[int], b: List[int]):
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def is_refusal(text: str):
+    return REFUSAL.search(text.lower()) is not None
+
+
+def stall_update(stall: Optional[dict], turns: List[Turn], is_scammed: bool, config: StallConfig):
+    # Called once per round with the scammer turn and the victim reply just judged;
+    # only these two turns are shingled, the earlier ones come from the previous state
+    stall = stall or {"scammer": [], "victim": [], "loop_streak": 0, "refusal_streak": 0}
+    recent = {"scammer": stall["scammer"], "victim": stall["victim"]}
+    repeated = bool(turns)
+    for turn in turns:
+        current = shingles(turn["text"], config.ngram)
+        history = recent[turn["role"]]
+        repeated = repeated and any(jaccard(current, old) >= config.similarity for old in history)
+        recent[turn["role"]] = (history + [current])[-config.window:]
+
+    victim = next((t for t in reversed(turns) if t["role"] == "victim"), None)
+    refused = victim is not None and not is_scammed and is_refusal(victim["text"])
+    loop_streak = stall["loop_streak"] + 1 if repeated else 0
+    refusal_streak = stall["refusal_streak"] + 1 if refused else 0
+    return {
+        **recent,
+        "loop_streak": loop_streak,
+        "refusal_streak": refusal_streak,
+        "stalled": loop_streak >= config.patience or refusal_streak >= config.refusals,
+    }
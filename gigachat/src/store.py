@@ -0,0 +1,261 @@
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+from uuid import uuid4
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from . import config
+
+# Hive-partitioned datasets under the store root, one row per turn and one row per dialogue,
+# plus verdicts re-scored later (see rescore.py), kept apart per scorer:
+#   <root>/messages/case=<case key>/date=<YYYY-MM-DD>/part-*.parquet
+#   <root>/dialogues/case=<case key>/date=<YYYY-MM-DD>/part-*.parquet
+#   <root>/rescored/scorer=<name>/case=<case key>/date=<YYYY-MM-DD>/part-*.parquet
+# Readers go through pyarrow.dataset, so filters on case/date prune directories and the rest are checked
+# against row group statistics before any column is decoded.
+
+PARTITIONING = ds.partitioning(pa.schema([("case", pa.string()), ("date", pa.string())]), flavor="hive")
+
+MESSAGES_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("victim", pa.string()),
+    ("turn", pa.int16()),
+    ("role", pa.string()),
+    ("text", pa.string()),
+    ("verdict", pa.string()),  # analyst verdict after this turn, null where the analyst did not run
+    ("is_scammed", pa.bool_()),
+    ("seconds", pa.float32()),
+    ("prompt_tokens", pa.int32()),
+    ("completion_tokens", pa.int32()),
+    ("case", pa.string()),
+    ("date", pa.string()),
+])
+
+DIALOGUES_SCHEMA = pa.schema([
+    ("run_id", pa.string()),  # unique per execution; reruns of a batch grid get new ones
+    ("thread_id", pa.string()),  # checkpoint thread, shared by reruns of the same job
+    ("victim", pa.string()),
+    ("source", pa.string()),  # ui | batch | ...
+    ("max_count", pa.int16()),
+    ("seed", pa.int32()),
+    ("message_count", pa.int16()),
+    ("is_scammed", pa.bool_()),
+    ("outcome", pa.string()),  # scammed | stalled | max_count
+    ("scammed_at", pa.int16()),  # first turn judged "scammed", null if never
+    ("analysis", pa.string()),
+    ("verdict_source", pa.string()),
+    ("error", pa.string()),
+    ("seconds", pa.float32()),
+    ("prompt_tokens", pa.int32()),
+    ("completion_tokens", pa.int32()),
+    ("cost", pa.float32()),
+    ("created", pa.timestamp("s", tz="UTC")),
+    ("case", pa.string()),
+    ("date", pa.string()),
+])
+
+RESCORED_SCHEMA = pa.schema([
+    ("run_id", pa.string()),
+    ("victim", pa.string()),
+    ("turn", pa.int16()),
+    ("old_verdict", pa.string()),
+    ("old_is_scammed", pa.bool_()),
+    ("verdict", pa.string()),  # null when rules alone could not decide
+    ("is_scammed", pa.bool_()),
+    ("source", pa.string()),  # rules | llm
+    ("scorer", pa.string()),
+    ("case", pa.string()),
+    ("date", pa.string()),
+])
+
+SCHEMAS = {"messages": MESSAGES_SCHEMA, "dialogues": DIALOGUES_SCHEMA, "rescored": RESCORED_SCHEMA}
+PARTITIONINGS = {
+    "messages": PARTITIONING,
+    "dialogues": PARTITIONING,
+    "rescored": ds.partitioning(pa.schema([("scorer", pa.string()), ("case", pa.string()), ("date", pa.string())]),
+                                flavor="hive"),
+}
+
+
+def dialogue_rows(thread_id: str, case: str, victim: str, state: dict, source: str = "batch",
+                  error: Optional[str] = None, created: Optional[datetime] = None, run_id: Optional[str] = None):
+    # state is a final DialogState (or a batch record carrying the same keys)
+    created = created or datetime.now(timezone.utc)
+    run_id = run_id or uuid4().hex
+    date = created.strftime("%Y-%m-%d")
+    transcript = state.get("transcript") or []
+    verdicts = {v["turn"]: v for v in state.get("verdicts") or []}
+    # Person metrics are appended in transcript order (speculative turns only once committed)
+    person_metrics = [m for m in state.get("metrics") or [] if m["node"] in ("scammer", "victim")]
+
+    messages = []
+    for i, turn in enumerate(transcript, start=1):
+        metric = person_metrics[i - 1] if i <= len(person_metrics) else {}
+        verdict = verdicts.get(i)
+        messages.append({
+            "run_id": run_id,
+            "victim": victim,
+            "turn": i,
+            "role": turn["role"],
+            "text": turn["text"],
+            "verdict": verdict["analysis"] if verdict else None,
+            "is_scammed": verdict["is_scammed"] if verdict else None,
+            "seconds": metric.get("seconds"),
+            "prompt_tokens": metric.get("prompt_tokens"),
+            "completion_tokens": metric.get("completion_tokens"),
+            "case": case,
+            "date": date,
+        })
+
+    metrics = state.get("metrics") or []
+    dialogue = {
+        "run_id": run_id,
+        "thread_id": thread_id,
+        "victim": victim,
+        "source": source,
+        "max_count": state.get("max_count"),
+        "seed": state.get("seed"),
+        "message_count": state.get("message_count", len(transcript)),
+        "is_scammed": bool(state.get("is_scammed")),
+        "outcome": state.get("outcome"),
+        "scammed_at": next((turn for turn, v in sorted(verdicts.items()) if v["is_scammed"]), None),
+        "analysis": state.get("analysis"),
+        "verdict_source": state.get("verdict_source"),
+        "error": error,
+        "seconds": sum(m["seconds"] for m in metrics),
+        "prompt_tokens": sum(m["prompt_tokens"] for m in metrics),
+        "completion_tokens": sum(m["completion_tokens"] for m in metrics),
+        "cost": sum(m["cost"] for m in metrics),
+        "created": created,
+        "case": case,
+        "date": date,
+    }
+    return messages, dialogue
+
+
+class ResultsStore:
+    # Buffers rows and writes them as one Parquet file per partition every flush_every dialogues,
+    # so batch runs produce a few large files rather than one per dialogue. Safe to share between threads.
+
+    def __init__(self, root: Optional[str] = None, flush_every: int = 1000):
+        # root defaults to RESULTS_PATH, read when the store is created rather than at import
+        self.root = root or config.RESULTS_PATH
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._rows = {"messages": [], "dialogues": []}
+
+    def add(self, thread_id: str, case: str, victim: str, state: dict, **kwargs):
+        messages, dialogue = dialogue_rows(thread_id, case, victim, state, **kwargs)
+        with self._lock:
+            self._rows["messages"].extend(messages)
+            self._rows["dialogues"].append(dialogue)
+            if len(self._rows["dialogues"]) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        for name, rows in self._rows.items():
+            if rows:
+                write_rows(self.root, name, rows)
+        self._rows = {"messages": [], "dialogues": []}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+
+def write_rows(root: str, name: str, rows: List[dict]):
+    table = pa.Table.from_pylist(rows, schema=SCHEMAS[name])
+    ds.write_dataset(table, os.path.join(root, name), format="parquet", partitioning=PARTITIONINGS[name],
+                     basename_template=f"part-{uuid4().hex}-{{i}}.parquet",
+                     existing_data_behavior="overwrite_or_ignore",
+                     max_rows_per_group=64 * 1024)
+
+
+def dataset(name: str, root: Optional[str] = None) -> Optional[ds.Dataset]:
+    path = os.path.join(root or config.RESULTS_PATH, name)
+    if not os.path.isdir(path):
+        return None
+    return ds.dataset(path, schema=SCHEMAS[name], format="parquet", partitioning=PARTITIONINGS[name])
+
+
+def make_filter(cases: Optional[Iterable[str]] = None, victims: Optional[Iterable[str]] = None,
+                since: Optional[str] = None, until: Optional[str] = None):
+    expr = None
+    for condition in (
+        pc.field("case").isin(list(cases)) if cases else None,
+        pc.field("victim").isin(list(victims)) if victims else None,
+        pc.field("date") >= since if since else None,
+        pc.field("date") <= until if until else None,
+    ):
+        if condition is not None:
+            expr = condition if expr is None else expr & condition
+    return expr
+
+
+SUCCESS_SCHEMA = pa.schema([("case", pa.string()), ("victim", pa.string()), ("turn", pa.int16()),
+                            ("scammed", pa.int64()), ("dialogues", pa.int64()), ("rate", pa.float64())])
+
+
+def success_by_turn(root: Optional[str] = None, **filters) -> pa.Table:
+    # Share of dialogues scammed by each turn per (case, victim): only three columns of the
+    # matching partitions are read, and grouping happens before anything reaches Python
+    data = dataset("dialogues", root)
+    if data is None:
+        return SUCCESS_SCHEMA.empty_table()
+    table = data.to_table(columns=["case", "victim", "scammed_at"], filter=make_filter(**filters))
+    totals = table.group_by(["case", "victim"]).aggregate([([], "count_all")])
+    hits = (table.filter(pc.is_valid(table["scammed_at"]))
+            .group_by(["case", "victim", "scammed_at"]).aggregate([([], "count_all")])
+            .rename_columns(["case", "victim", "turn", "hits"]))
+    joined = hits.join(totals, ["case", "victim"]).sort_by([("case", "ascending"), ("victim", "ascending"),
+                                                           ("turn", "ascending")])
+
+    # Few rows per group (one per turn), so the running sum is cheap in Python
+    rows, cumulative, key = [], 0, None
+    for row in joined.to_pylist():
+        if (row["case"], row["victim"]) != key:
+            key, cumulative = (row["case"], row["victim"]), 0
+        cumulative += row["hits"]
+        rows.append({"case": row["case"], "victim": row["victim"], "turn": row["turn"],
+                     "scammed": cumulative, "dialogues": row["count_all"], "rate": cumulative / row["count_all"]})
+    return pa.Table.from_pylist(rows, schema=SUCCESS_SCHEMA)
+
+
+def dialogue_totals(root: Optional[str] = None, **filters) -> pa.Table:
+    data = dataset("dialogues", root)
+    if data is None:
+        return pa.table({})
+    table = data.to_table(columns=["case", "victim", "is_scammed", "message_count", "seconds",
+                                   "prompt_tokens", "completion_tokens", "cost"],
+                          filter=make_filter(**filters))
+    table = table.set_column(2, "is_scammed", pc.cast(table["is_scammed"], pa.int8()))
+    return table.group_by(["case", "victim"]).aggregate([
+        ([], "count_all"),
+        ("is_scammed", "mean"),
+        ("message_count", "mean"),
+        ("seconds", "mean"),
+        ("prompt_tokens", "sum"),
+        ("completion_tokens", "sum"),
+        ("cost", "sum"),
+    ])
+
+
+def load_messages(root: Optional[str] = None, run_ids: Optional[Iterable[str]] = None, **filters) -> pa.Table:
+    data = dataset("messages", root)
+    if data is None:
+        return MESSAGES_SCHEMA.empty_table()
+    expr = make_filter(**filters)
+    if run_ids:
+        condition = pc.field("run_id").isin(list(run_ids))
+        expr = condition if expr is None else expr & condition
+    return data.to_table(filter=expr)
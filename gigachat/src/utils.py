@@ -1,29 +1,30 @@
-from typing import TypedDict, List, Dict
+import operator
+from typing import Annotated, TypedDict, List, Dict, Optional
 
-from langchain_core.prompts import ChatPromptTemplate
-from langgraph.graph import END, START, MessagesState, StateGraph
-from pydantic import BaseModel
+from langgraph.graph import END, START, StateGraph
 
-class Role(TypedDict):
-    name: str
-    bio: str
-    template: str
+from .models import *
 
 
-class FraudCase(BaseModel):
-    name: str
-    description: str
-    success_condition: str
-    profiles: Dict[str, Role]
-
-
-class DialogState(MessagesState):
+class DialogState(TypedDict):
+    # The dialogue itself is only in transcript: each turn is stored once, already rendered
+    transcript: Annotated[List[Turn], add_turns]
+    metrics: Annotated[List[NodeMetric], operator.add]
+    verdicts: Annotated[List[Verdict], operator.add]
+    summary: str = ""
+    summary_upto: int = 0
     fraud_scheme: str
     fraud_success: str
     message_count: int = 0
     is_scammed: bool = False
+    analysis: str
+    verdict_source: str
     is_stopped: bool = 0
+    stall: Optional[dict] = None  # incremental state of src.stall
+    outcome: Optional[str] = None  # scammed | stalled | max_count, set once the dialogue ends
     max_count: int = 20
+    seed: int = 0
+    speculative: Optional[dict] = None
 
 
 # class Role(TypedDict):
@@ -40,12 +41,14 @@ DEBATES_TEMPLATE = """
 Не торопись раскрывать все мысли, у вас будет время.
 """
 
-analyst_prompt = ChatPromptTemplate.from_template(
-    """
-{template}
-
-Переписка:
-{history}
+SUMMARY_TEMPLATE = """
+Ты ведешь краткий конспект переписки между {name} и {name2}.
+Тебе будут даны текущий конспект и новые реплики.
+Обнови конспект: сохрани ключевые факты, аргументы, обещания и позицию каждой стороны.
+Не больше 5 предложений. Отправь только сам конспект.
+"""
 
+# Appended to the analyst's case template in the live graph, where the verdict is parsed by src.budget.parse_verdict
+VERDICT_INSTRUCTION = """
+Ответь ровно одним словом, без пояснений: scammed, если условие успеха мошенника выполнено, иначе no.
 """
-)
\ No newline at end of file
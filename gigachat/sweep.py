@@ -0,0 +1,233 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from cli import POLICIES
+from src.jobqueue import SHARDS, JobQueue, worker_name
+
+# Sweeps across several worker processes on one host, coordinated through the job queue of src.jobqueue:
+#   python sweep.py enqueue investments secure_account --victims 0 1 --runs 50 --sweep june
+#   python sweep.py work --sweep june --concurrency 8 --checkpoints checkpoints.sqlite   # in each worker process
+#   python sweep.py status --sweep june --watch 10
+#   python sweep.py export --sweep june --output june.jsonl
+# Workers can be killed and restarted at any time: unfinished jobs go back to the queue once their lease
+# expires, and with a shared --checkpoints file the dialogue continues from its last checkpoint.
+# The queue and checkpoint files must be on a local disk: SQLite in WAL mode does not work over NFS or SMB.
+# Run settings (memory, schedule, ...) belong to the sweep and are fixed by its first enqueue.
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Durable multi-process sweeps of fraud dialogues")
+    parser.add_argument("--queue", help="queue file, default SWEEP_PATH")
+    parser.add_argument("--sweep", default="default", help="sweep name, several sweeps can share a queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="add case x victim x seed jobs to a sweep")
+    enqueue.add_argument("cases", nargs="+", help="case keys from src.roles_and_cases.cases")
+    enqueue.add_argument("--victims", nargs="+", type=int, default=[0])
+    enqueue.add_argument("--runs", type=int, default=1, help="seeds 0..runs-1 per case and victim")
+    enqueue.add_argument("--max-count", type=int, default=10, help="messages per dialogue")
+    enqueue.add_argument("--memory-window", type=int, help="fold turns older than this into a running summary")
+    enqueue.add_argument("--speculative", action="store_true")
+    enqueue.add_argument("--no-stall", action="store_true")
+    enqueue.add_argument("--schedule", choices=POLICIES, default="always")
+
+    work = commands.add_parser("work", help="run jobs of a sweep until none are left")
+    work.add_argument("--concurrency", type=int, default=8, help="dialogues in flight in this process")
+    work.add_argument("--checkpoints", help="SQLite checkpoint file, shared by the workers to resume dialogues")
+    work.add_argument("--shards", help=f"only take jobs of these shards (0-{SHARDS - 1}), e.g. 0-7 or 3,5")
+    work.add_argument("--lease", type=float, default=900, help="seconds a job stays leased without renewal")
+    work.add_argument("--max-attempts", type=int, default=3)
+    work.add_argument("--poll", type=float, default=5, help="seconds between checks while others finish")
+    work.add_argument("--fake-llm", type=float, metavar="LATENCY", help="offline dry run, see cli.py")
+    work.add_argument("--quiet", action="store_true")
+
+    status = commands.add_parser("status", help="print the progress of a sweep")
+    status.add_argument("--watch", type=float, metavar="SECONDS", help="repeat until the sweep is finished")
+
+    export = commands.add_parser("export", help="write finished dialogues of a sweep")
+    export.add_argument("--output", default="-", help="JSONL file, '-' for stdout")
+    export.add_argument("--store", action="store_true", help="append them to the Parquet results store instead")
+
+    commands.add_parser("retry", help="put failed jobs back into the queue")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "runs", 1) < 1 or getattr(args, "concurrency", 1) < 1:
+        parser.error("--runs and --concurrency must be positive")
+    if getattr(args, "shards", None):
+        try:
+            args.shards = parse_shards(args.shards)
+        except ValueError as e:
+            parser.error(str(e))
+    return parser, args
+
+
+def parse_shards(spec: str, count: int = SHARDS):
+    shards = set()
+    for part in spec.split(","):
+        first, _, last = part.partition("-")
+        shards.update(range(int(first), int(last or first) + 1))
+    if not shards or min(shards) < 0 or max(shards) >= count:
+        raise ValueError(f"--shards must be within 0-{count - 1}")
+    return sorted(shards)
+
+
+def format_progress(progress: dict):
+    line = (f"{progress['done']}/{progress['total']} done, {progress['failed']} failed, "
+            f"{progress['leased']} running on {progress['workers']} workers, {progress['pending']} pending, "
+            f"{progress['per_minute']:.1f}/min")
+    if progress["eta_seconds"] is not None:
+        line += f", ~{progress['eta_seconds'] / 60:.0f} min left"
+    return line
+
+
+async def work(queue, sweep: str, worker: str, concurrency: int, settings: dict,
+               checkpoint_path=None, shards=None, poll: float = 5, on_result=None):
+    from contextlib import nullcontext
+
+    from batch import BatchJob, run_job
+    from src.checkpoints import async_checkpointer
+    from src.utils import MemoryConfig, ScheduleConfig, StallConfig
+
+    memory = MemoryConfig(window=settings["memory_window"]) if settings.get("memory_window") else None
+    stall = None if settings.get("no_stall") else StallConfig()
+    schedule = ScheduleConfig(policy=settings.get("schedule", "always"))
+    held = set()
+
+    async def renew():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            for job_id in await asyncio.to_thread(queue.renew, worker, list(held), sweep):
+                print(f"lost the lease of {job_id}, its result will be discarded", file=sys.stderr, flush=True)
+
+    async with (async_checkpointer(checkpoint_path) if checkpoint_path else nullcontext()) as checkpointer:
+        async def slot():
+            while True:
+                leased = await asyncio.to_thread(queue.lease, worker, sweep, 1, shards)
+                if not leased:
+                    # Leases held by other workers may still expire and come back
+                    if not await asyncio.to_thread(queue.unfinished, sweep, shards):
+                        return
+                    await asyncio.sleep(poll)
+                    continue
+                job_id, payload = leased[0]
+                held.add(job_id)
+                try:
+                    record = await run_job(BatchJob(**{**payload, "sweep": sweep}), memory, checkpointer,
+                                           speculative=settings.get("speculative", False), stall=stall,
+                                           schedule=schedule)
+                    if record["error"] is None:
+                        record["stored"] = await asyncio.to_thread(queue.complete, worker, job_id, record, sweep)
+                    else:
+                        record["retry"] = await asyncio.to_thread(queue.fail, worker, job_id, record["error"], sweep)
+                finally:
+                    held.discard(job_id)
+                if on_result is not None:
+                    on_result(record)
+
+        renewer = asyncio.create_task(renew())
+        try:
+            await asyncio.gather(*(slot() for _ in range(concurrency)))
+        finally:
+            renewer.cancel()
+
+
+def main(argv=None):
+    parser, args = parse_args(argv)
+
+    if args.queue is None:
+        from src.config import SWEEP_PATH
+        args.queue = SWEEP_PATH
+    queue = JobQueue(args.queue, lease_seconds=getattr(args, "lease", 900),
+                     max_attempts=getattr(args, "max_attempts", 3))
+
+    if args.command == "enqueue":
+        from batch import make_grid
+        from src.roles_and_cases import cases, victims
+
+        unknown = [c for c in args.cases if c not in cases] + [str(v) for v in args.victims if v not in victims]
+        if unknown:
+            parser.error(f"unknown case or victim keys: {', '.join(unknown)}")
+        settings = {"memory_window": args.memory_window, "speculative": args.speculative,
+                    "no_stall": args.no_stall, "schedule": args.schedule}
+        jobs = make_grid(args.cases, args.victims, max_counts=(args.max_count,), repeats=args.runs)
+        try:
+            added = queue.enqueue(jobs, args.sweep, settings)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"{added} new jobs, {len(jobs) - added} already in sweep {args.sweep!r}", file=sys.stderr)
+        print(format_progress(queue.progress(args.sweep)), file=sys.stderr)
+        return 0
+
+    if args.command == "status":
+        while True:
+            progress = queue.progress(args.sweep)
+            print(format_progress(progress), flush=True)
+            if not args.watch or not (progress["pending"] or progress["leased"]):
+                return 0
+            time.sleep(args.watch)
+
+    if args.command == "retry":
+        print(f"{queue.retry_failed(args.sweep)} failed jobs queued again", file=sys.stderr)
+        return 0
+
+    if args.command == "export":
+        records = queue.results(args.sweep)
+        if args.store:
+            # Run once per finished sweep: the store appends, it does not deduplicate
+            from src.store import ResultsStore
+            with ResultsStore() as store:
+                for record in records:
+                    store.add(record["thread_id"], record["case"], record["victim_name"], record,
+                              source="batch", error=None)
+        else:
+            with open("/dev/stdout" if args.output == "-" else args.output, "w", encoding="utf-8") as out:
+                for record in records:
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        print(f"{len(records)} dialogues exported", file=sys.stderr)
+        return 0
+
+    settings = queue.settings(args.sweep)
+    if settings is None:
+        parser.error(f"sweep {args.sweep!r} has no jobs, run enqueue first")
+
+    if args.fake_llm is not None:
+        from langchain_core.globals import set_llm_cache
+
+        from graph import set_llm
+        from src.fake_llm import FakeChatModel
+        set_llm(FakeChatModel(latency_mean=args.fake_llm))
+        set_llm_cache(None)
+
+    worker = worker_name()
+    done = 0
+
+    def on_result(record):
+        nonlocal done
+        done += 1
+        if args.quiet:
+            return
+        if record["error"] is not None:
+            status = f"failed ({record['retry'] or 'lease lost'}): {record['error']}"
+        elif not record["stored"]:
+            status = "discarded, the lease was taken over"
+        else:
+            status = f"{record['outcome'] or 'not scammed'} after {record['message_count']} messages"
+        print(f"[{worker} #{done}] {record['thread_id']} {status} ({record['elapsed']:.1f} s)",
+              file=sys.stderr, flush=True)
+
+    print(f"{worker}: sweep {args.sweep!r}, concurrency {args.concurrency}; "
+          f"{format_progress(queue.progress(args.sweep))}", file=sys.stderr, flush=True)
+    started = time.perf_counter()
+    asyncio.run(work(queue, args.sweep, worker, args.concurrency, settings, args.checkpoints, args.shards,
+                     args.poll, on_result))
+    progress = queue.progress(args.sweep)
+    print(f"{worker}: {done} dialogues in {time.perf_counter() - started:.1f} s; {format_progress(progress)}",
+          file=sys.stderr, flush=True)
+    return 1 if progress["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import pytest
+
+from src.budget import parse_verdict, trim_reply
+from src.roles_and_cases import investments, victims
+
+SCAMMER = investments.profiles["scammer"]
+VICTIM = victims[0]
+
+
+def test_cut_off_reply_loses_its_unfinished_sentence():
+    text = "Это надёжный фонд. Доходность сто процентов в месяц! Переведите сегодня, и уже через"
+    assert trim_reply(text, SCAMMER, VICTIM, cut_off=True) == (
+        "Это надёжный фонд. Доходность сто процентов в месяц!", True)
+
+
+def test_cut_off_reply_without_a_sentence_end_is_kept():
+    assert trim_reply("Переведите сегодня, и уже через", SCAMMER, VICTIM, cut_off=True) == (
+        "Переведите сегодня, и уже через", False)
+
+
+def test_complete_reply_at_the_limit_is_kept():
+    assert trim_reply("Это надёжный фонд.", SCAMMER, VICTIM, cut_off=True) == ("Это надёжный фонд.", False)
+
+
+def test_other_sides_turn_is_cut():
+    text = "Скам Скамыч: Вложите сейчас. Иван Иваныч: Готов! Скам Скамыч: Отлично"
+    assert trim_reply(text, SCAMMER, VICTIM) == ("Вложите сейчас.", True)
+
+
+def test_reply_that_is_only_the_other_sides_line_is_kept():
+    assert trim_reply("Иван Иваныч: Готов!", SCAMMER, VICTIM) == ("Иван Иваныч: Готов!", False)
+
+
+@pytest.mark.parametrize("text, verdict", [
+    ("scammed", "scammed"),
+    ("Scammed.", "scammed"),
+    ("not scammed", "not scammed"),
+    ("Жертва scammed", "not scammed"),
+    ("", "not scammed"),
+])
+def test_parse_verdict(text, verdict):
+    assert parse_verdict(text) == verdict
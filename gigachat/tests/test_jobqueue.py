@@ -0,0 +1,66 @@
+import pytest
+from pydantic import BaseModel
+
+from src import jobqueue
+from src.jobqueue import JobQueue
+
+
+class Job(BaseModel):
+    thread_id: str
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobqueue.time, "time", lambda: now[0])
+    return now
+
+
+def test_rate_of_a_sweep_that_has_just_started(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue([Job(thread_id=str(i)) for i in range(10)])
+    for job_id, _ in queue.lease("w", limit=4):
+        queue.complete("w", job_id, {})
+    clock[0] += 2
+    progress = queue.progress()
+    # 4 jobs in the 2 s since they finished, not 4 jobs per 300 s window
+    assert progress["per_minute"] == pytest.approx(120)
+    assert progress["eta_seconds"] == pytest.approx(3)
+
+
+def test_rate_uses_the_window_once_the_sweep_is_older(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"))
+    queue.enqueue([Job(thread_id=str(i)) for i in range(3)])
+    job_id, _ = queue.lease("w")[0]
+    queue.complete("w", job_id, {})
+    clock[0] += 600
+    job_id, _ = queue.lease("w")[0]
+    queue.complete("w", job_id, {})
+    clock[0] += 60
+    assert queue.progress(window=300)["per_minute"] == pytest.approx(0.2)
+
+
+def test_expired_lease_is_reclaimed_before_pending_jobs(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=10)
+    queue.enqueue([Job(thread_id=str(i)) for i in range(3)])
+    (job_id, _), = queue.lease("dead")
+    clock[0] += 5
+    assert queue.renew("dead", [job_id]) == []
+    clock[0] += 11
+    # The dead worker's job is part done in the checkpoints, so it comes before the pending ones
+    assert [j for j, _ in queue.lease("alive")] == [job_id]
+    assert queue.renew("dead", [job_id]) == [job_id]
+    assert not queue.complete("dead", job_id, {"by": "dead"})
+    assert queue.complete("alive", job_id, {"by": "alive"})
+    assert queue.results() == [{"by": "alive"}]
+
+
+def test_lease_expired_after_the_last_attempt_fails_the_job(tmp_path, clock):
+    queue = JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=10, max_attempts=2)
+    queue.enqueue([Job(thread_id="0")])
+    for worker in ("first", "second"):
+        assert len(queue.lease(worker)) == 1
+        clock[0] += 11
+    assert queue.lease("third") == []
+    progress = queue.progress()
+    assert (progress["failed"], progress["pending"], progress["leased"]) == (1, 0, 0)
@@ -0,0 +1,55 @@
+import sys
+
+import httpx
+import pytest
+
+from src import pool
+from src.pool import RateLimiter, _retry_delay
+
+
+class ResponseError(Exception):
+    # Shaped like gigachat.exceptions.ResponseError(url, status_code, content, headers)
+    pass
+
+
+def test_retry_after_header_is_honoured():
+    error = ResponseError("url", 429, b"", {"Retry-After": "7"})
+    assert _retry_delay(error, 0, base=1, cap=30) == 7
+
+
+@pytest.mark.parametrize("error", [
+    ResponseError("url", 400, b"", {}),
+    ValueError("not an API error"),
+])
+def test_non_retryable_errors_give_up(error):
+    assert _retry_delay(error, 0, base=1, cap=30) is None
+
+
+def test_transport_errors_back_off_within_the_cap():
+    for attempt in range(10):
+        assert 0 <= _retry_delay(httpx.ConnectError("down"), attempt, base=1, cap=30) <= 30
+
+
+def test_retry_path_does_not_import_gigachat(monkeypatch):
+    monkeypatch.delitem(sys.modules, "gigachat.exceptions", raising=False)
+    monkeypatch.setitem(sys.modules, "gigachat", None)
+    assert _retry_delay(ResponseError("url", 503, b"", None), 0, base=1, cap=30) is not None
+
+
+def test_rate_limiter_spaces_out_requests_beyond_the_burst(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(pool.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rps=2, burst=1)
+    assert limiter.reserve() == 0
+    assert limiter.reserve() == pytest.approx(0.5)
+    assert limiter.reserve() == pytest.approx(1.0)
+    now[0] += 1.0
+    assert limiter.reserve() == pytest.approx(0.5)
+
+
+def test_rate_limiter_waits_out_a_pause(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(pool.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(tpm=600)
+    limiter.pause(3)
+    assert limiter.reserve(10) == pytest.approx(3)
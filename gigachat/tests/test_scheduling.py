@@ -0,0 +1,44 @@
+import pytest
+
+from src.roles_and_cases import investments
+from src.scheduling import POLICIES, analyst_due
+from src.utils import ScheduleConfig, StallConfig, make_turn
+
+# A victim reply the cues policy skips, judged last two messages ago, so every policy can skip it mid-dialogue
+ROUND = [make_turn("scammer", "Скам Скамыч", "Подумайте ещё."), make_turn("victim", "Иван Иваныч", "Хорошо, а куда?")]
+SKIPPING = sorted(set(POLICIES) - {"always"})
+
+
+def state(message_count, max_count=20, stall=None):
+    return {"transcript": ROUND, "message_count": message_count, "max_count": max_count,
+            "verdicts": [{"turn": message_count - 2}], "stall": stall}
+
+
+@pytest.mark.parametrize("policy", SKIPPING)
+def test_policy_skips_a_turn_mid_dialogue(policy):
+    assert not analyst_due(state(4), investments, ScheduleConfig(policy=policy))
+
+
+@pytest.mark.parametrize("policy", SKIPPING)
+def test_last_message_is_always_judged(policy):
+    assert analyst_due(state(20), investments, ScheduleConfig(policy=policy))
+
+
+@pytest.mark.parametrize("policy", SKIPPING)
+def test_round_that_stalls_the_dialogue_is_always_judged(policy):
+    config = StallConfig(refusals=2)
+    refusing = dict(state(4), transcript=[ROUND[0], make_turn("victim", "Иван Иваныч", "Нет, не буду.")],
+                    stall={"scammer": [], "victim": [], "loop_streak": 0, "refusal_streak": 1})
+    assert analyst_due(refusing, investments, ScheduleConfig(policy=policy), stall=config)
+    assert not analyst_due(refusing, investments, ScheduleConfig(policy=policy), stall=StallConfig(refusals=3))
+
+
+def test_every_waits_for_its_gap():
+    schedule = ScheduleConfig(policy="every", every=2)
+    assert not analyst_due(dict(state(6), verdicts=[{"turn": 4}]), investments, schedule)
+    assert analyst_due(dict(state(6), verdicts=[{"turn": 2}]), investments, schedule)
+
+
+def test_unknown_policy_is_an_error():
+    with pytest.raises(ValueError):
+        analyst_due(state(4), investments, ScheduleConfig(policy="sometimes"))
@@ -0,0 +1,36 @@
+from src.stall import stall_update
+from src.utils import StallConfig, make_turn
+
+
+def round_of(scammer, victim):
+    return [make_turn("scammer", "Скам Скамыч", scammer), make_turn("victim", "Иван Иваныч", victim)]
+
+
+def test_repeating_rounds_stall_after_patience():
+    config = StallConfig(patience=2)
+    turns = round_of("Переведите деньги на безопасный счёт сегодня", "Я подумаю над вашим предложением")
+    stall = None
+    for expected in (False, False, True):
+        stall = stall_update(stall, turns, False, config)
+        assert stall["stalled"] is expected
+
+
+def test_new_rounds_reset_the_loop_streak():
+    config = StallConfig(patience=2)
+    stall = stall_update(None, round_of("Переведите деньги сегодня", "Я подумаю"), False, config)
+    stall = stall_update(stall, round_of("Переведите деньги сегодня", "Я подумаю"), False, config)
+    stall = stall_update(stall, round_of("Наш фонд работает десять лет", "А лицензия у вас есть"), False, config)
+    assert stall["loop_streak"] == 0 and not stall["stalled"]
+
+
+def test_refusals_in_a_row_stall():
+    config = StallConfig(refusals=2)
+    stall = stall_update(None, round_of("Вложите сейчас", "Нет, не буду"), False, config)
+    assert not stall["stalled"]
+    stall = stall_update(stall, round_of("Последний шанс", "Вы мошенник, до свидания"), False, config)
+    assert stall["stalled"]
+
+
+def test_scammed_reply_is_no_refusal():
+    stall = stall_update(None, round_of("Вложите сейчас", "Нет, не буду"), True, StallConfig(refusals=1))
+    assert stall["refusal_streak"] == 0
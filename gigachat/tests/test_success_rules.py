@@ -0,0 +1,59 @@
+import pytest
+
+from src.roles_and_cases import investments, secure_account
+
+
+@pytest.mark.parametrize("case", [investments, secure_account])
+@pytest.mark.parametrize("text", [
+    "Я не уверена, что готова перевести",
+    "Готова перевести, если вы пришлёте договор",
+    "Может, и готова перевести, подумаю до завтра",
+])
+def test_hedged_agreement_is_left_to_the_analyst(case, text):
+    assert case.success_rules.match(text) is None
+
+
+@pytest.mark.parametrize("case, text", [
+    (investments, "Готов!"),
+    (investments, "Хорошо, я готов вложить деньги."),
+    (investments, "Не уверен был сначала. Да, готов!"),
+    (secure_account, "Хорошо, я готова перевести деньги на указанный вами счет"),
+    (secure_account, "Код 123456, я перевела деньги"),
+])
+def test_clear_agreement_is_scammed(case, text):
+    assert case.success_rules.match(text) is True
+
+
+@pytest.mark.parametrize("case, text", [
+    (secure_account, "Мошенники всегда просят, чтобы ты перевел деньги."),
+    (secure_account, "Вы хотите, чтобы я перевела деньги на другой счёт."),
+    (secure_account, "Переведу, когда сын приедет и всё проверит"),
+    (secure_account, "Мне сказали, что я готова перевести, но это не так"),
+    (investments, "Сын сказал: будь готов."),
+    (investments, "Теперь я готов ко всему, что вы скажете."),
+])
+def test_quoted_or_conditional_transfer_is_left_to_the_analyst(case, text):
+    assert case.success_rules.match(text) is None
+
+
+def test_undecided_transfer_is_ambiguous():
+    assert secure_account.success_rules.match("Я уже не знаю, переведу или нет") is None
+
+
+@pytest.mark.parametrize("text", [
+    "Хорошо, перевел вам 1000 рублей",
+    "Да, давайте, вкладываю все сбережения",
+    "Беру! Куда платить?",
+    "Нет, не готов.",
+])
+def test_money_talk_is_never_settled_as_not_scammed(text):
+    assert investments.success_rules.match(text) is None
+
+
+@pytest.mark.parametrize("case", [investments, secure_account])
+@pytest.mark.parametrize("text", [
+    "Здравствуйте, а кто это?",
+    "Расскажите подробнее о вашем фонде",
+])
+def test_unrelated_reply_is_not_scammed(case, text):
+    assert case.success_rules.match(text) is False
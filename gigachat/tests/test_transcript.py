@@ -0,0 +1,29 @@
+from langgraph.checkpoint.memory import InMemorySaver
+
+import graph
+from src.checkpoints import thread_config
+from src.fake_llm import FakeChatModel
+from src.roles_and_cases import investments, victims
+from src.utils import add_turns, make_turn
+
+
+def test_add_turns_copies_references_only():
+    left = [make_turn("scammer" if i % 2 == 0 else "victim", "Имя", f"реплика {i}") for i in range(50)]
+    right = [make_turn("victim", "Иван Иваныч", "Готов!")]
+    merged = add_turns(left, right)
+    assert len(left) == 50
+    # The existing turns are shared, not rendered again
+    assert all(a is b for a, b in zip(merged, left + right))
+
+
+def test_snapshots_are_not_changed_by_later_turns():
+    graph.set_llm(FakeChatModel(reply_words=5, seed=0))
+    app = graph.build_graph(investments, victims[0], checkpointer=InMemorySaver())
+    config = thread_config("snapshots")
+    snapshots = list(app.stream(graph.make_inputs(investments, 6), config, stream_mode="values"))
+    assert snapshots[-1]["message_count"] == 6
+    for values in snapshots:
+        assert len(values["transcript"]) == values["message_count"]
+    for snapshot in app.get_state_history(config):
+        assert len(snapshot.values.get("transcript", [])) == snapshot.values.get("message_count", 0)
+    assert "messages" not in snapshots[-1]